@@ -1,3 +1,4 @@
+import asyncio
 import socket
 import platform
 import requests
@@ -5,10 +6,14 @@ import subprocess
 import time
 import threading
 import os
+import signal
 import psutil
+import logging
 from gpu_detector import GPUDetector
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
+from typing import List
 import uvicorn
 
 # Configuration: Use environment variable or a default.
@@ -17,7 +22,19 @@ CONTROL_PLANE_URL = os.getenv("CONTROL_PLANE_URL", "http://10.248.127.222:8080")
 AGENT_PORT = 8001
 REPORT_INTERVAL = 15  # seconds
 
-app = FastAPI(title="GPU Nebula Agent", version="1.0.0")
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+app = FastAPI(title="GPU Nebula Agent", version="1.0.0", default_response_class=ORJSONResponse)
+
+# One detector for the whole agent so NVML handles and host info are reused between calls
+agent_detector = GPUDetector()
+# Latest detection result, published by the reporting thread. Readers take the reference
+# as-is; the thread swaps in a new dict rather than mutating the current one.
+latest_gpu_report = None
 
 class JobRequest(BaseModel):
     job_id: int
@@ -25,6 +42,9 @@ class JobRequest(BaseModel):
     gpu_id: str
     workload_type: str
 
+class JobStatusBatchRequest(BaseModel):
+    pids: List[int]
+
 def get_local_ip():
     """Get local IP address"""
     try:
@@ -41,13 +61,13 @@ async def run_job(job_request: JobRequest):
     """Execute a job on this agent"""
     try:
         import shlex
-        print(f"🚀 Received job {job_request.job_id}: {job_request.command}")
+        logger.info("🚀 Received job %s: %s", job_request.job_id, job_request.command)
         
         # Determine GPU index from gpu_id (e.g., "GPU-0" -> 0)
         try:
             gpu_index = int(job_request.gpu_id.split('-')[-1])
         except (ValueError, IndexError):
-            print(f"⚠️ Could not parse GPU index from '{job_request.gpu_id}'. Defaulting to all GPUs.")
+            logger.warning("⚠️ Could not parse GPU index from '%s'. Defaulting to all GPUs.", job_request.gpu_id)
             gpu_index = ""  # Let CUDA decide
 
         # Set environment to isolate the job to the assigned GPU
@@ -55,15 +75,19 @@ async def run_job(job_request: JobRequest):
             **os.environ,
             'CUDA_VISIBLE_DEVICES': str(gpu_index)
         }
-        print(f"Setting CUDA_VISIBLE_DEVICES={gpu_index} for job {job_request.job_id}")
+        logger.debug("Setting CUDA_VISIBLE_DEVICES=%s for job %s", gpu_index, job_request.job_id)
 
-        # Launch the job securely, without using a shell
-        process = subprocess.Popen(
+        # Launch the job securely, without using a shell. Spawning forks and execs the
+        # child, so do it on a worker thread rather than stalling the event loop.
+        process = await asyncio.to_thread(
+            subprocess.Popen,
             shlex.split(job_request.command),
             shell=False,
             env=env,
             stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
+            stderr=subprocess.PIPE,
+            # Own process group, so cancel_job can signal the job and its children together
+            start_new_session=(os.name == "posix")
         )
         
         return {
@@ -74,17 +98,43 @@ async def run_job(job_request: JobRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def get_process_status(pid: int) -> str:
+    """Return "running", "not_running" (e.g., zombie) or "not_found" for a PID."""
+    try:
+        process = psutil.Process(pid)
+        return "running" if process.is_running() else "not_running"
+    except psutil.NoSuchProcess:
+        return "not_found"
+
 @app.get("/agent/job-status/{pid}")
 async def get_job_status(pid: int):
     """Check the status of a process by its PID."""
     try:
-        process = psutil.Process(pid)
-        if process.is_running():
-            return {"pid": pid, "status": "running"}
-        else:
-            # Process exists but is not running (e.g., zombie)
-            return {"pid": pid, "status": "not_running"}
-    except psutil.NoSuchProcess:
+        return {"pid": pid, "status": get_process_status(pid)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/agent/job-status-batch")
+async def get_job_status_batch(batch: JobStatusBatchRequest):
+    """Check the status of several processes in one call: {pid: {"status": ...}}."""
+    try:
+        return {pid: {"status": get_process_status(pid)} for pid in batch.pids}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/agent/cancel-job/{pid}")
+async def cancel_job(pid: int):
+    """Terminate a job process, and on POSIX the process group it leads, by its PID."""
+    try:
+        if os.name == "posix":
+            try:
+                os.killpg(pid, signal.SIGTERM)
+                return {"pid": pid, "status": "terminated"}
+            except ProcessLookupError:
+                pass  # Leads no group (started before jobs got their own session)
+        os.kill(pid, signal.SIGTERM)
+        return {"pid": pid, "status": "terminated"}
+    except ProcessLookupError:
         return {"pid": pid, "status": "not_found"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -92,8 +142,12 @@ async def get_job_status(pid: int):
 @app.get("/agent/status")
 async def get_status():
     """Get agent status"""
-    detector = GPUDetector()
-    gpus = detector.detect_gpus().get('gpus', [])
+    global latest_gpu_report
+    report = latest_gpu_report
+    if report is None:
+        # Nothing sampled yet; detection blocks on NVML/subprocess calls, so keep it off the loop
+        report = latest_gpu_report = await asyncio.to_thread(agent_detector.detect_gpus)
+    gpus = report.get('gpus', [])
     return {
         "hostname": socket.gethostname(),
         "status": "healthy",
@@ -105,12 +159,12 @@ async def get_status():
 
 def report_to_backend():
     """Report this agent's status to control plane"""
-    detector = GPUDetector()
+    global latest_gpu_report
     while True:
         try:
             hostname = socket.gethostname()
             
-            gpu_report_data = detector.detect_gpus()
+            gpu_report_data = latest_gpu_report = agent_detector.detect_gpus()
             
             payload = {
                 "agent_info": {
@@ -127,7 +181,7 @@ def report_to_backend():
                 }
             }
             
-            print(f"📡 Reporting to control plane: {CONTROL_PLANE_URL}/api/v1/agent/report-in")
+            logger.debug("📡 Reporting to control plane: %s/api/v1/agent/report-in", CONTROL_PLANE_URL)
             headers = {
                 # Mimic a standard browser User-Agent to bypass simple network filters
                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
@@ -140,21 +194,21 @@ def report_to_backend():
                 timeout=10
             )
             
-            if response.status_code == 200:
-                print(f"✅ Successfully reported to control plane ({hostname})")
+            if response.ok:  # 202 Accepted: the control plane buffers reports
+                logger.debug("✅ Successfully reported to control plane (%s)", hostname)
             else:
-                print(f"❌ Failed to report. Status: {response.status_code}.")
+                logger.error("❌ Failed to report. Status: %s.", response.status_code)
                 # If the response is HTML, save it for inspection.
                 if "html" in response.headers.get("Content-Type", "").lower():
                     error_html_path = "error_page.html"
                     with open(error_html_path, "w", encoding="utf-8") as f:
                         f.write(response.text)
-                    print(f"📝 An HTML error page was received. Full response saved to: {error_html_path}")
+                    logger.error("📝 An HTML error page was received. Full response saved to: %s", error_html_path)
                 
         except requests.exceptions.ConnectionError:
-            print(f"🔌 Cannot connect to control plane at {CONTROL_PLANE_URL}")
-        except Exception as e:
-            print(f"❌ Error reporting to control plane: {e}")
+            logger.warning("🔌 Cannot connect to control plane at %s", CONTROL_PLANE_URL)
+        except Exception:
+            logger.exception("❌ Error reporting to control plane")
         
         time.sleep(REPORT_INTERVAL)
 
@@ -189,8 +243,8 @@ if __name__ == "__main__":
     print(f"🌐 IP Address: {ip}")
     print(f"💻 Platform: {platform.system()}")
     print(f"📡 Control Plane: {CONTROL_PLANE_URL}")
-    detector = GPUDetector()
-    initial_gpus = detector.detect_gpus().get('gpus', [])
+    latest_gpu_report = agent_detector.detect_gpus()
+    initial_gpus = latest_gpu_report.get('gpus', [])
     print(f"🔧 GPUs Found: {len(initial_gpus)}")
     
     # Perform a connection check before starting services
@@ -1,21 +1,71 @@
-from sqlalchemy import create_engine, Column, Integer, String, ForeignKey, DateTime, Text, Boolean
-from sqlalchemy.orm import declarative_base, sessionmaker, relationship
+from sqlalchemy import create_engine, event, Index, Column, Integer, SmallInteger, Float, String, ForeignKey, DateTime, Text, Boolean, Computed
+from sqlalchemy.types import TypeDecorator
+from sqlalchemy.orm import declarative_base, sessionmaker, scoped_session, relationship
+from sqlalchemy.pool import QueuePool
 from sqlalchemy.sql import func
+from contextvars import ContextVar
+from datetime import timezone
+from enum import IntEnum
+import threading
 import os
 
 Base = declarative_base()
 
+class JobStatus(IntEnum):
+    """Job lifecycle states, stored as small integers; the API exposes the lowercase name."""
+    QUEUED = 0
+    PENDING = 1
+    RUNNING = 2
+    COMPLETED = 3
+    FAILED = 4
+    CANCELLED = 5
+    
+    @property
+    def label(self) -> str:
+        return self.name.lower()
+
+class JobStatusType(TypeDecorator):
+    """SMALLINT column that loads as JobStatus members."""
+    impl = SmallInteger
+    cache_ok = True
+    
+    def process_bind_param(self, value, dialect):
+        if isinstance(value, str):
+            value = JobStatus[value.upper()]  # Accept the API names as well
+        return None if value is None else int(value)
+    
+    def process_result_value(self, value, dialect):
+        return None if value is None else JobStatus(value)
+
+class UTCDateTime(TypeDecorator):
+    """DATETIME kept as naive UTC (SQLite stores no zone) and loaded as timezone-aware UTC."""
+    impl = DateTime
+    cache_ok = True
+    
+    def process_bind_param(self, value, dialect):
+        if value is not None and value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value  # Naive values are taken to be UTC already
+    
+    def process_result_value(self, value, dialect):
+        return None if value is None else value.replace(tzinfo=timezone.utc)
+
 class Agent(Base):
     __tablename__ = 'agents'
     id = Column(Integer, primary_key=True)
-    hostname = Column(String, unique=True, nullable=False)
+    hostname = Column(String, unique=True, nullable=False, index=True)
     ip_address = Column(String)
     os = Column(String)
-    last_seen = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    last_seen = Column(UTCDateTime, server_default=func.now(), onupdate=func.now())
     is_active = Column(Boolean, default=True)
+    gpu_report_hash = Column(String(32))  # blake2b of the last reported GPU list
     
     gpus = relationship("GPU", back_populates="agent")
     jobs = relationship("Job", back_populates="agent")
+    
+    __table_args__ = (
+        Index("ix_agent_last_seen", "last_seen"),
+    )
 
 class GPU(Base):
     __tablename__ = 'gpus'
@@ -28,6 +78,7 @@ class GPU(Base):
     model = Column(String)
     serial = Column(String)
     pci_bus_id = Column(String)
+    pci_index = Column(Integer)  # Device index parsed from the ID at ingestion ("GPU-2" -> 2)
     driver_version = Column(String)
     
     # Real-time metrics (updated by gpu_detector.py)
@@ -36,13 +87,37 @@ class GPU(Base):
     utilization = Column(Integer)  # GPU utilization %
     memory_total = Column(Integer)  # Total VRAM in MB
     memory_used = Column(Integer)   # Used VRAM in MB
-    vram = Column(Integer)  # Keep for backward compatibility
+    # Smoothed telemetry used for scheduling (exponential moving averages of the samples above)
+    temp_ema = Column(Float)
+    util_ema = Column(Float)
+    # Keep for backward compatibility: whole GB, computed by SQLite at write time
+    vram = Column(Integer, Computed("COALESCE(memory_total, 0) / 1073741824", persisted=True))
     
     # Scheduling metadata
     is_available = Column(Boolean, default=True)
-    last_updated = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    last_updated = Column(UTCDateTime, server_default=func.now(), onupdate=func.now())
     
     jobs = relationship("Job", back_populates="gpu")
+    
+    __table_args__ = (
+        Index("ix_gpu_agent_id", "agent_id"),
+        Index("ix_gpu_status_available", "status", "is_available"),  # scheduler candidate filter
+    )
+
+class GPUSample(Base):
+    """Telemetry time series: one row per GPU each time its agent reports new readings"""
+    __tablename__ = 'gpu_samples'
+    id = Column(Integer, primary_key=True)
+    gpu_id = Column(String, ForeignKey('gpus.id'))
+    timestamp = Column(UTCDateTime, server_default=func.now())
+    temperature = Column(Integer)
+    utilization = Column(Integer)
+    memory_used = Column(Integer)
+    
+    __table_args__ = (
+        Index("ix_gpu_sample_gpu_ts", "gpu_id", timestamp.desc()),
+        Index("ix_gpu_sample_ts", "timestamp"),  # retention pruning
+    )
 
 class Job(Base):
     __tablename__ = 'jobs'
@@ -51,7 +126,7 @@ class Job(Base):
     # Job metadata
     workload_type = Column(String)  # inference, training, fine-tuning, etc.
     command = Column(Text)  # Command to execute
-    status = Column(String, default="pending")  # pending, running, completed, failed, queued
+    status = Column(JobStatusType, default=JobStatus.PENDING)
     
     # Resource assignment
     assigned_gpu_id = Column(String, ForeignKey('gpus.id'), nullable=True)
@@ -61,30 +136,41 @@ class Job(Base):
     pid = Column(Integer, nullable=True)  # Process ID for local jobs
     
     # Timing
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
-    started_at = Column(DateTime(timezone=True), nullable=True)
-    finished_at = Column(DateTime(timezone=True), nullable=True)
+    created_at = Column(UTCDateTime, server_default=func.now())
+    started_at = Column(UTCDateTime, nullable=True)
+    finished_at = Column(UTCDateTime, nullable=True)
     
     # Legacy fields (keep for compatibility)
     type = Column(String)  # Maps to workload_type
     payload = Column(Text)  # Maps to command
-    start_time = Column(DateTime(timezone=True))  # Maps to started_at
-    end_time = Column(DateTime(timezone=True))  # Maps to finished_at
+    start_time = Column(UTCDateTime)  # Maps to started_at
+    end_time = Column(UTCDateTime)  # Maps to finished_at
     
     # Relationships
     gpu = relationship("GPU", back_populates="jobs")
     agent = relationship("Agent", back_populates="jobs")
     history_entries = relationship("History", back_populates="job")
+    
+    # (status, agent_id) also serves status-only filters such as status IN ('running', 'pending')
+    __table_args__ = (
+        Index("ix_job_status_agent_id", "status", "agent_id"),
+        Index("ix_job_status_gpu_id", "status", "assigned_gpu_id"),
+        Index("ix_job_created_at", "created_at"),  # list_jobs ordering
+    )
 
 class History(Base):
     __tablename__ = 'history'
     id = Column(Integer, primary_key=True)
     action = Column(String)  # submitted, scheduled, started, completed, failed
     job_id = Column(Integer, ForeignKey('jobs.id'))
-    timestamp = Column(DateTime(timezone=True), server_default=func.now())
+    timestamp = Column(UTCDateTime, server_default=func.now())
     details = Column(Text)  # JSON string for structured data
     
     job = relationship("Job", back_populates="history_entries")
+    
+    __table_args__ = (
+        Index("ix_history_job_ts", "job_id", timestamp.desc()),
+    )
 
 class Network(Base):
     __tablename__ = 'networks'
@@ -94,8 +180,44 @@ class Network(Base):
 
 # Database setup
 DB_PATH = "c:/dev/GPU-Nebula/backend/control_plane.db"
-engine = create_engine(f'sqlite:///{DB_PATH}')
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+engine = create_engine(
+    f'sqlite:///{DB_PATH}',
+    connect_args={"check_same_thread": False},
+    poolclass=QueuePool,
+    pool_size=20,        # Connections kept open for concurrent requests
+    max_overflow=10,     # Extra connections allowed under bursts
+    pool_timeout=30,     # Seconds to wait for a free connection
+    pool_pre_ping=True,  # Validate connections before use
+    pool_recycle=3600,   # Recycle connections every hour
+    echo=False  # Set to True for SQL debugging
+)
+
+@event.listens_for(engine, "connect")
+def _sqlite_pragmas(dbapi_conn, _):
+    # WAL lets topology/status readers run while agent reports are being written;
+    # NORMAL sync is durable in WAL mode and avoids an fsync on every commit.
+    cur = dbapi_conn.cursor()
+    cur.execute("PRAGMA journal_mode=WAL")
+    cur.execute("PRAGMA synchronous=NORMAL")
+    cur.execute("PRAGMA temp_store=MEMORY")
+    cur.execute("PRAGMA cache_size=-64000")
+    cur.execute("PRAGMA mmap_size=268435456")
+    cur.close()
+
+# Objects keep their loaded state across commit: handlers and the scheduler read back what
+# they just wrote, and expiring everything would turn each of those reads into a SELECT.
+session_factory = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
+
+# Request-scoped sessions: the API middleware sets a fresh scope per request, and the
+# context var follows the request into whichever threadpool thread runs its dependencies
+# and handler. Code outside a request (background tasks, scripts) falls back to the thread.
+session_scope = ContextVar("session_scope", default=None)
+
+def _current_session_scope():
+    scope = session_scope.get()
+    return scope if scope is not None else threading.get_ident()
+
+SessionLocal = scoped_session(session_factory, scopefunc=_current_session_scope)
 
 def create_tables():
     print("Creating database tables...")
@@ -103,8 +225,16 @@ def create_tables():
     if os.path.exists(DB_PATH):
         os.remove(DB_PATH)
         print("Removed old database file.")
+    # A leftover WAL would be replayed into the fresh database file
+    for suffix in ("-wal", "-shm"):
+        if os.path.exists(DB_PATH + suffix):
+            os.remove(DB_PATH + suffix)
     
     Base.metadata.create_all(engine)
+    # create_all skips indexes on tables that already exist, so add any missing ones
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
     print("Tables created successfully!")
 
 if __name__ == '__main__':
@@ -4,26 +4,125 @@ Supports multiple GPU detection methods with fallbacks
 Network-binding independent implementation
 """
 
+import atexit
+import csv
 import platform
 import subprocess
 import json
 import os
 import re
 import logging
-from typing import Dict, List, Optional, Any
+import threading
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from itertools import combinations
+from typing import Dict, List, Optional, Any, Iterable, Iterator
+
+try:
+    import pynvml
+    HAS_PYNVML = True
+except ImportError:  # Optional: NVIDIA GPUs are then detected through nvidia-smi
+    HAS_PYNVML = False
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Constants
 TEMPERATURE_THRESHOLD = 90  # Celsius
+MACOS_PROFILE_TTL = 60  # Seconds a system_profiler display report is reused
+NVML_MIN_SAMPLE_INTERVAL = 1.0  # Seconds between NVML metric reads, however often callers ask
+WMI_GPU_KEYWORDS = ('nvidia', 'amd', 'radeon', 'geforce', 'quadro', 'tesla', 'intel arc')
+# GPU lines of `lspci [-nn]`, e.g.
+#   01:00.0 VGA compatible controller [0300]: NVIDIA Corporation GA102 [GeForce RTX 3090] [10de:2204] (rev a1)
+# capturing the slot and the device name without the vendor:device IDs and revision
+LSPCI_GPU_RE = re.compile(
+    r'^(?P<slot>\S+)\s+(?:VGA compatible controller|3D controller)[^:]*:\s*'
+    r'(?P<name>.+?)(?:\s+\[[0-9a-fA-F]{4}:[0-9a-fA-F]{4}\])?(?:\s+\(rev [^)]*\))?\s*$',
+    re.MULTILINE
+)
+
+def _cpu_model() -> str:
+    """CPU model name from the OS without spawning a process (platform.processor() may)"""
+    try:
+        if platform.system() == "Linux":
+            with open("/proc/cpuinfo", encoding="utf-8", errors="replace") as f:
+                for line in f:
+                    if line.startswith("model name"):
+                        return line.split(":", 1)[1].strip()
+        elif platform.system() == "Windows":
+            cpu_info = os.environ.get("PROCESSOR_IDENTIFIER")
+            if cpu_info:
+                return cpu_info
+    except OSError:
+        pass
+    return platform.machine() or "Unknown CPU"
+
+@lru_cache(maxsize=1)
+def _host_server_info() -> Dict[str, Any]:
+    """Host identity for detection results; fixed for the life of the process"""
+    return {
+        "id": "server-0",
+        "name": f"Host-{platform.node()}",
+        "type": "server",
+        "cpu": _cpu_model(),
+        "status": "healthy",
+        "uptime": "99.9%",
+        "os": f"{platform.system()} {platform.release()}"
+    }
+
+@dataclass(frozen=True)
+class NVMLDevice:
+    """An NVML device handle with the fields that never change while it is attached"""
+    # Declared by hand: dataclass(slots=True) needs Python 3.10
+    __slots__ = ("handle", "id", "name", "model", "serial", "pci_bus_id", "driver_version")
+    handle: Any
+    id: str
+    name: str
+    model: str
+    serial: str
+    pci_bus_id: str
+    driver_version: str
 
 class GPUDetector:
+    __slots__ = ("system", "gpu_info", "detection_methods", "_nvml_devices", "_nvml_sample", "_methods", "_preferred_method",
+                 "_connections_key", "_connections")
+    
+    # NVML is process-wide state shared by every detector instance
+    _nvml_initialized = False
+    _nvml_lock = threading.Lock()
+    # Resolved nvidia-smi executable (None: not found); probing it spawns a process per candidate
+    _nvidia_smi_path = None
+    _nvidia_smi_probed = False
+    # `nvidia-smi topo -m` matrix; GPU interconnect wiring is fixed while the process runs
+    _nvidia_topology = None
+    # Last `system_profiler SPDisplaysDataType -json` result and when it was taken
+    _macos_profile = None
+    _macos_profile_ts = 0.0
+    
     def __init__(self):
         self.system = platform.system().lower()
         self.gpu_info = []
         self.detection_methods = []
+        self._nvml_devices = None  # List[NVMLDevice], enumerated on first NVML poll
+        self._nvml_sample = None  # (monotonic timestamp, GPU dicts) of the last NVML read
+        self._methods = self._detection_methods_for_platform()
+        self._preferred_method = None  # Method that last found GPUs, tried first
+        # Connection list built for the last set of GPUs (ids and models), reused while it holds
+        self._connections_key = None
+        self._connections = None
+    
+    def _detection_methods_for_platform(self) -> List:
+        """Detection methods to try in order, leaving out those that cannot work on this OS"""
+        # NVML reads the same counters in-process; nvidia-smi is only the fallback without pynvml
+        methods = [self._detect_nvidia_nvml] if HAS_PYNVML else [self._detect_nvidia_smi]
+        methods += [self._detect_amd_rocm, self._detect_intel_gpu]
+        if self.system == "windows":
+            methods.append(self._detect_windows_wmi)
+        elif self.system == "linux":
+            methods.append(self._detect_linux_lspci)
+        elif self.system == "darwin":
+            methods.append(self._detect_macos_system)
+        return methods
         
     def detect_gpus(self) -> Dict[str, Any]:
         """Main method to detect GPUs using multiple fallback methods"""
@@ -32,31 +131,41 @@ class GPUDetector:
         # Ensure proper environment for GPU detection regardless of network binding
         env = self._setup_detection_environment()
         
-        detection_methods = [
-            self._detect_nvidia_nvml,
-            self._detect_nvidia_smi,
-            self._detect_amd_rocm,
-            self._detect_intel_gpu,
-            self._detect_windows_wmi,
-            self._detect_linux_lspci,
-            self._detect_macos_system
-        ]
+        # Once a method has worked, later calls go straight to it; the full ladder only
+        # runs again if it stops finding GPUs
+        if self._preferred_method is not None:
+            result = self._try_detection_method(self._preferred_method, env)
+            if result:
+                return result
+            self._preferred_method = None
         
-        for method in detection_methods:
-            try:
-                result = method(env)
-                if result and result.get('gpus'):
-                    self.gpu_info = result['gpus']
-                    self.detection_methods.append(method.__name__)
-                    logger.info(f"✅ GPU Detection successful using {method.__name__}")
-                    return result
-            except Exception as e:
-                logger.warning(f"⚠️ {method.__name__} failed. Reason: {e}")
-                continue
+        for method in self._methods:
+            result = self._try_detection_method(method, env)
+            if result:
+                self._preferred_method = method
+                self.detection_methods.append(method.__name__)
+                logger.info(f"✅ GPU Detection successful using {method.__name__}")
+                return result
         
         logger.warning("🎭 All detection methods failed, using mock data")
         return self._get_mock_data()
     
+    def _try_detection_method(self, method, env: Dict[str, str]) -> Optional[Dict[str, Any]]:
+        """Run one detection method, returning its result only if it found GPUs"""
+        try:
+            result = method(env)
+            if result and result.get('gpus'):
+                self.gpu_info = result['gpus']
+                return result
+        except Exception as e:
+            logger.warning(f"⚠️ {method.__name__} failed. Reason: {e}")
+        return None
+    
+    def reset(self):
+        """Forget the preferred detection method so the next call tries every method again"""
+        self._preferred_method = None
+        self._nvml_sample = None
+    
     def _setup_detection_environment(self) -> Dict[str, str]:
         """Setup environment variables for GPU detection regardless of network binding"""
         env = os.environ.copy()
@@ -90,86 +199,27 @@ class GPUDetector:
     def _detect_nvidia_nvml(self, env: Dict[str, str]) -> Optional[Dict[str, Any]]:
         """Detect NVIDIA GPUs using NVML (most accurate)"""
         try:
-            import pynvml
-            pynvml.nvmlInit()
+            if not HAS_PYNVML:
+                raise ImportError("pynvml")
+            self._init_nvml()
             
-            driver_version = pynvml.nvmlSystemGetDriverVersion()
-            if isinstance(driver_version, bytes):
-                driver_version = driver_version.decode('utf-8')
-
-            gpu_count = pynvml.nvmlDeviceGetCount()
-            gpus = []
-            
-            for i in range(gpu_count):
-                handle = pynvml.nvmlDeviceGetHandleByIndex(i)
-                
-                name = pynvml.nvmlDeviceGetName(handle)
-                if isinstance(name, bytes):
-                    name = name.decode('utf-8')
-                
-                uuid = pynvml.nvmlDeviceGetUUID(handle)
-                if isinstance(uuid, bytes):
-                    uuid = uuid.decode('utf-8')
-
-                pci_info = pynvml.nvmlDeviceGetPciInfo(handle)
-                pci_bus_id = pci_info.busId
-                if isinstance(pci_bus_id, bytes):
-                    pci_bus_id = pci_bus_id.decode('utf-8')
-
-                try:
-                    serial = pynvml.nvmlDeviceGetSerial(handle)
-                    if isinstance(serial, bytes):
-                        serial = serial.decode('utf-8')
-                except pynvml.NVMLError:
-                    serial = f"Unknown-{i}"
-
-                memory_info = pynvml.nvmlDeviceGetMemoryInfo(handle)
-                
-                try:
-                    temp = pynvml.nvmlDeviceGetTemperature(handle, pynvml.NVML_TEMPERATURE_GPU)
-                except pynvml.NVMLError:
-                    temp = 0
-                
-                status = "healthy"
-                if temp > TEMPERATURE_THRESHOLD:
-                    status = "overheating"
-                elif temp == 0:
-                    status = "unknown"
-
-                try:
-                    power = pynvml.nvmlDeviceGetPowerUsage(handle) / 1000.0
-                except pynvml.NVMLError:
-                    power = 0.0
-                
+            # Polling NVML slows the workloads on the GPUs being read, so metrics are sampled
+            # at most once per interval and callers in between get copies of the last read
+            now = time.monotonic()
+            sample = self._nvml_sample
+            if sample is not None and now - sample[0] < NVML_MIN_SAMPLE_INTERVAL:
+                gpus = [dict(gpu) for gpu in sample[1]]
+            else:
+                # Handles and static device info are enumerated once; each poll only reads metrics
+                if self._nvml_devices is None:
+                    self._nvml_devices = self._enumerate_nvml_devices()
                 try:
-                    utilization = pynvml.nvmlDeviceGetUtilizationRates(handle)
-                    gpu_util = utilization.gpu
-                    mem_util = utilization.memory
+                    gpus = [self._read_nvml_device(device) for device in self._nvml_devices]
                 except pynvml.NVMLError:
-                    gpu_util = 0
-                    mem_util = 0
-                
-                gpu_data = {
-                    "id": f"GPU-{i}",
-                    "name": f"GPU-{i}",
-                    "model": str(name),
-                    "serial": serial,
-                    "pci_bus_id": pci_bus_id,
-                    "type": "gpu",
-                    "status": status,
-                    "temperature": temp,
-                    "powerUsage": power,
-                    "memoryUsed": memory_info.used,
-                    "memoryTotal": memory_info.total,
-                    "utilization": gpu_util,
-                    "memoryUtilization": mem_util,
-                    "detection_method": "nvidia_nvml",
-                    "driver_version": driver_version,
-                    "is_available": True
-                }
-                gpus.append(gpu_data)
-            
-            pynvml.nvmlShutdown()
+                    self._nvml_devices = None  # e.g. a GPU fell off the bus: re-enumerate next time
+                    raise
+                self._nvml_sample = (now, gpus)
+                gpus = [dict(gpu) for gpu in gpus]
 
             return {
                 "gpus": gpus,
@@ -184,6 +234,100 @@ class GPUDetector:
         except Exception as e:
             raise Exception(f"NVML detection failed: {e}")
 
+    @classmethod
+    def _init_nvml(cls):
+        """Initialize NVML once per process; it is shut down at interpreter exit"""
+        with cls._nvml_lock:
+            if not cls._nvml_initialized:
+                pynvml.nvmlInit()
+                atexit.register(pynvml.nvmlShutdown)
+                cls._nvml_initialized = True
+
+    def _enumerate_nvml_devices(self) -> List[NVMLDevice]:
+        """Handle and static fields of every NVML device"""
+        driver_version = pynvml.nvmlSystemGetDriverVersion()
+        if isinstance(driver_version, bytes):
+            driver_version = driver_version.decode('utf-8')
+
+        devices = []
+        for i in range(pynvml.nvmlDeviceGetCount()):
+            handle = pynvml.nvmlDeviceGetHandleByIndex(i)
+            
+            name = pynvml.nvmlDeviceGetName(handle)
+            if isinstance(name, bytes):
+                name = name.decode('utf-8')
+
+            pci_info = pynvml.nvmlDeviceGetPciInfo(handle)
+            pci_bus_id = pci_info.busId
+            if isinstance(pci_bus_id, bytes):
+                pci_bus_id = pci_bus_id.decode('utf-8')
+
+            try:
+                serial = pynvml.nvmlDeviceGetSerial(handle)
+                if isinstance(serial, bytes):
+                    serial = serial.decode('utf-8')
+            except pynvml.NVMLError:
+                serial = f"Unknown-{i}"
+
+            devices.append(NVMLDevice(
+                handle=handle,
+                id=f"GPU-{i}",
+                name=f"GPU-{i}",
+                model=str(name),
+                serial=serial,
+                pci_bus_id=pci_bus_id,
+                driver_version=driver_version
+            ))
+        return devices
+
+    def _read_nvml_device(self, device: NVMLDevice) -> Dict[str, Any]:
+        """Current metrics of one NVML device merged with its static fields"""
+        handle = device.handle
+        memory_info = pynvml.nvmlDeviceGetMemoryInfo(handle)
+        
+        try:
+            temp = pynvml.nvmlDeviceGetTemperature(handle, pynvml.NVML_TEMPERATURE_GPU)
+        except pynvml.NVMLError:
+            temp = 0
+        
+        status = "healthy"
+        if temp > TEMPERATURE_THRESHOLD:
+            status = "overheating"
+        elif temp == 0:
+            status = "unknown"
+
+        try:
+            power = pynvml.nvmlDeviceGetPowerUsage(handle) / 1000.0
+        except pynvml.NVMLError:
+            power = 0.0
+        
+        try:
+            utilization = pynvml.nvmlDeviceGetUtilizationRates(handle)
+            gpu_util = utilization.gpu
+            mem_util = utilization.memory
+        except pynvml.NVMLError:
+            gpu_util = 0
+            mem_util = 0
+        
+        return {
+            "id": device.id,
+            "name": device.name,
+            "model": device.model,
+            "serial": device.serial,
+            "pci_bus_id": device.pci_bus_id,
+            "type": "gpu",
+            "status": status,
+            "temperature": temp,
+            "powerUsage": power,
+            "memoryUsed": memory_info.used,
+            "memoryTotal": memory_info.total,
+            "utilization": gpu_util,
+            "memoryUtilization": mem_util,
+            "detection_method": "nvidia_nvml",
+            "driver_version": device.driver_version,
+            "is_available": True
+        }
+
     def _detect_nvidia_smi(self, env: Dict[str, str]) -> Optional[Dict[str, Any]]:
         """Detect NVIDIA GPUs using nvidia-smi command"""
         try:
@@ -226,7 +370,14 @@ class GPUDetector:
             raise Exception(f"nvidia-smi detection failed: {e}")
     
     def _find_nvidia_smi(self, env: Dict[str, str]) -> Optional[str]:
-        """Find nvidia-smi executable in various locations"""
+        """Find nvidia-smi executable in various locations (probed once per process)"""
+        cls = type(self)
+        if not cls._nvidia_smi_probed:
+            cls._nvidia_smi_path = self._probe_nvidia_smi(env)
+            cls._nvidia_smi_probed = True
+        return cls._nvidia_smi_path
+    
+    def _probe_nvidia_smi(self, env: Dict[str, str]) -> Optional[str]:
         if self.system == 'windows':
             possible_paths = [
                 r"C:\Program Files\NVIDIA Corporation\NVSMI\nvidia-smi.exe",
@@ -377,6 +528,11 @@ class GPUDetector:
 
     def _create_connections(self, gpus: List[Dict]) -> List[Dict[str, Any]]:
         """Create connections between GPUs and server, using topology info if available"""
+        # The interconnect only changes when the GPUs do, so skip the pairwise pass until then
+        key = tuple((gpu["id"], gpu["model"]) for gpu in gpus)
+        if key == self._connections_key:
+            return [dict(connection) for connection in self._connections]  # Copy: callers own it
+
         connections = []
         
         # Create server-to-GPU connections
@@ -390,49 +546,50 @@ class GPUDetector:
                 "status": "active"
             })
 
-        # Get GPU-to-GPU topology if available
-        env = self._setup_detection_environment()
-        topology = self._get_nvidia_topology(env)
+        # Get GPU-to-GPU topology if available (probed once per process)
+        cls = type(self)
+        if cls._nvidia_topology is None:
+            cls._nvidia_topology = self._get_nvidia_topology(self._setup_detection_environment())
+        topology = cls._nvidia_topology
         gpu_map = {f"GPU{i}": gpu["id"] for i, gpu in enumerate(gpus)}
 
         if topology:
-            for i in range(len(gpus)):
-                for j in range(i + 1, len(gpus)):
-                    gpu1_name = f"GPU{i}"
-                    gpu2_name = f"GPU{j}"
-                    conn_type = topology.get(gpu1_name, {}).get(gpu2_name, "X")
+            for i, j in combinations(range(len(gpus)), 2):
+                gpu1_name = f"GPU{i}"
+                gpu2_name = f"GPU{j}"
+                conn_type = topology.get(gpu1_name, {}).get(gpu2_name, "X")
 
-                    if conn_type and conn_type != "X":
-                        bandwidth = "Unknown"
-                        if conn_type.startswith("NV"):
-                            bandwidth = f"{int(conn_type[2:]) * 50} GB/s"  # Rough estimate for NVLink
-                        elif conn_type in ["PXB", "PIX"]:
-                            bandwidth = "16 GB/s"
-                        elif conn_type in ["SYS", "NODE"]:
-                            bandwidth = "8 GB/s"
+                if conn_type and conn_type != "X":
+                    bandwidth = "Unknown"
+                    if conn_type.startswith("NV"):
+                        bandwidth = f"{int(conn_type[2:]) * 50} GB/s"  # Rough estimate for NVLink
+                    elif conn_type in ["PXB", "PIX"]:
+                        bandwidth = "16 GB/s"
+                    elif conn_type in ["SYS", "NODE"]:
+                        bandwidth = "8 GB/s"
 
-                        connections.append({
-                            "id": f"conn-gpu-{i}-{j}",
-                            "source": gpu_map[gpu1_name],
-                            "target": gpu_map[gpu2_name],
-                            "type": conn_type,
-                            "bandwidth": bandwidth,
-                            "status": "active"
-                        })
-        else:
-            # Fallback GPU-to-GPU connections
-            for i in range(len(gpus)):
-                for j in range(i + 1, len(gpus)):
                     connections.append({
                         "id": f"conn-gpu-{i}-{j}",
-                        "source": gpus[i]["id"],
-                        "target": gpus[j]["id"],
-                        "type": "nvlink" if "nvidia" in gpus[i]["model"].lower() else "pcie",
-                        "bandwidth": "600 GB/s" if "nvidia" in gpus[i]["model"].lower() else "32 GB/s",
+                        "source": gpu_map[gpu1_name],
+                        "target": gpu_map[gpu2_name],
+                        "type": conn_type,
+                        "bandwidth": bandwidth,
                         "status": "active"
                     })
+        else:
+            # Fallback GPU-to-GPU connections: NVLink assumed only between two NVIDIA GPUs
+            is_nvidia = ["nvidia" in gpu["model"].lower() for gpu in gpus]
+            connections.extend({
+                "id": f"conn-gpu-{i}-{j}",
+                "source": gpus[i]["id"],
+                "target": gpus[j]["id"],
+                "type": "nvlink" if is_nvidia[i] and is_nvidia[j] else "pcie",
+                "bandwidth": "600 GB/s" if is_nvidia[i] and is_nvidia[j] else "32 GB/s",
+                "status": "active"
+            } for i, j in combinations(range(len(gpus)), 2))
         
-        return connections
+        self._connections_key, self._connections = key, connections
+        return [dict(connection) for connection in connections]
 
     def _detect_amd_rocm(self, env: Dict[str, str]) -> Optional[Dict[str, Any]]:
         """Detect AMD GPUs using ROCm tools"""
@@ -457,18 +614,16 @@ class GPUDetector:
                         "status": "success"
                     }
             
-            # Try clinfo as fallback
-            result = subprocess.run(['clinfo'], capture_output=True, text=True, timeout=10, env=env)
-            if result.returncode == 0:
-                gpus = self._parse_clinfo_output(result.stdout)
-                if gpus:
-                    return {
-                        "gpus": gpus,
-                        "servers": [self._get_host_server()],
-                        "connections": self._create_connections(gpus),
-                        "detection_method": "amd_clinfo",
-                        "status": "success"
-                    }
+            # Try clinfo as fallback; its output can run to hundreds of KB, so parse it as it streams
+            gpus = self._parse_clinfo_output(self._stream_command(['clinfo'], env, timeout=10))
+            if gpus:
+                return {
+                    "gpus": gpus,
+                    "servers": [self._get_host_server()],
+                    "connections": self._create_connections(gpus),
+                    "detection_method": "amd_clinfo",
+                    "status": "success"
+                }
                     
         except Exception as e:
             raise Exception(f"AMD ROCm detection failed: {e}")
@@ -547,18 +702,15 @@ class GPUDetector:
             raise Exception("lspci only available on Linux")
             
         try:
-            result = subprocess.run(['lspci', '-nn'], capture_output=True, text=True, timeout=10, env=env)
-            
-            if result.returncode == 0:
-                gpus = self._parse_lspci_output(result.stdout)
-                if gpus:
-                    return {
-                        "gpus": gpus,
-                        "servers": [self._get_host_server()],
-                        "connections": self._create_connections(gpus),
-                        "detection_method": "linux_lspci",
-                        "status": "success"
-                    }
+            gpus = self._parse_lspci_output(self._stream_command(['lspci', '-nn'], env, timeout=10))
+            if gpus:
+                return {
+                    "gpus": gpus,
+                    "servers": [self._get_host_server()],
+                    "connections": self._create_connections(gpus),
+                    "detection_method": "linux_lspci",
+                    "status": "success"
+                }
                     
         except Exception as e:
             raise Exception(f"Linux lspci detection failed: {e}")
@@ -569,16 +721,26 @@ class GPUDetector:
             raise Exception("system_profiler only available on macOS")
             
         try:
-            result = subprocess.run(
-                ['system_profiler', 'SPDisplaysDataType', '-json'],
-                capture_output=True,
-                text=True,
-                timeout=10,
-                env=env
-            )
-            
-            if result.returncode == 0:
+            # system_profiler takes seconds and the display hardware rarely changes, so its
+            # output is reused for MACOS_PROFILE_TTL seconds
+            cls = type(self)
+            if cls._macos_profile is not None and time.monotonic() - cls._macos_profile_ts < MACOS_PROFILE_TTL:
+                data = cls._macos_profile
+            else:
+                result = subprocess.run(
+                    ['system_profiler', 'SPDisplaysDataType', '-json'],
+                    capture_output=True,
+                    text=True,
+                    timeout=10,
+                    env=env
+                )
+                if result.returncode != 0:
+                    logger.warning(f"macOS system_profiler command failed with code {result.returncode}. Stderr: {result.stderr.strip()}")
+                    return None
                 data = json.loads(result.stdout)
+                cls._macos_profile, cls._macos_profile_ts = data, time.monotonic()
+            
+            if data:
                 gpus = self._parse_macos_system_output(data)
                 if gpus:
                     return {
@@ -588,30 +750,35 @@ class GPUDetector:
                         "detection_method": "macos_system",
                         "status": "success"
                     }
-            else:
-                logger.warning(f"macOS system_profiler command failed with code {result.returncode}. Stderr: {result.stderr.strip()}")
                     
         except Exception as e:
             raise Exception(f"macOS system detection failed: {e}")
     
+    def _stream_command(self, cmd: List[str], env: Dict[str, str], timeout: float) -> Iterator[str]:
+        """
+        Yield a command's stdout lines as they are produced, so parsing overlaps the run and
+        the output is never held in full. Raises CalledProcessError on a non-zero exit.
+        """
+        with subprocess.Popen(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            env=env,
+            creationflags=subprocess.CREATE_NO_WINDOW if self.system == 'windows' else 0
+        ) as process:
+            watchdog = threading.Timer(timeout, process.kill)
+            watchdog.start()
+            try:
+                yield from process.stdout
+            finally:
+                watchdog.cancel()
+        if process.returncode != 0:
+            raise subprocess.CalledProcessError(process.returncode, cmd)
+    
     def _get_host_server(self) -> Dict[str, Any]:
         """Get host system information"""
-        try:
-            cpu_info = platform.processor() or "Unknown CPU"
-            if not cpu_info or cpu_info == "Unknown CPU":
-                cpu_info = platform.machine()
-        except:
-            cpu_info = "Unknown CPU"
-        
-        return {
-            "id": "server-0",
-            "name": f"Host-{platform.node()}",
-            "type": "server",
-            "cpu": cpu_info,
-            "status": "healthy",
-            "uptime": "99.9%",
-            "os": f"{platform.system()} {platform.release()}"
-        }
+        return dict(_host_server_info())  # Copy: callers own the returned dict
     
     def _get_mock_data(self) -> Dict[str, Any]:
         """Return mock data when real detection fails"""
@@ -656,10 +823,9 @@ class GPUDetector:
         
         return gpus
     
-    def _parse_clinfo_output(self, output: str) -> List[Dict[str, Any]]:
-        """Parse clinfo output"""
+    def _parse_clinfo_output(self, lines: Iterable[str]) -> List[Dict[str, Any]]:
+        """Parse clinfo output lines"""
         gpus = []
-        lines = output.strip().split('\n')
         
         gpu_count = 0
         for line in lines:
@@ -692,87 +858,69 @@ class GPUDetector:
     def _parse_wmic_output(self, output: str) -> List[Dict[str, Any]]:
         """Parse wmic output"""
         gpus = []
-        lines = output.strip().split('\n')
+        # /format:csv prints blank lines before the header; columns are keyed by the header
+        rows = csv.DictReader(line for line in output.splitlines() if line.strip())
         
         gpu_count = 0
-        for line in lines[1:]:  # Skip header
-            if not line.strip():
-                continue
-                
+        for row in rows:
             try:
-                parts = line.split(',')
-                if len(parts) >= 2:
-                    name = parts[1].strip() if len(parts) > 1 else f"GPU-{gpu_count}"
+                name = (row.get("Name") or "").strip() or f"GPU-{gpu_count}"
+                
+                # Filter out basic display adapters
+                if any(keyword in name.lower() for keyword in WMI_GPU_KEYWORDS):
+                    memory_str = (row.get("AdapterRAM") or "").strip()
+                    memory = int(memory_str) if memory_str.isdigit() else 8000000000
                     
-                    # Filter out basic display adapters
-                    if any(keyword in name.lower() for keyword in ['nvidia', 'amd', 'radeon', 'geforce', 'quadro', 'tesla', 'intel arc']):
-                        memory_str = parts[2].strip() if len(parts) > 2 else "0"
-                        try:
-                            memory = int(memory_str) if memory_str.isdigit() else 8000000000
-                        except ValueError:
-                            memory = 8000000000
-                        
-                        gpu_data = {
-                            "id": f"gpu-{gpu_count}",
-                            "name": f"GPU-{gpu_count}",
-                            "model": name,
-                            "type": "gpu",
-                            "status": "healthy",
-                            "temperature": 65,
-                            "powerUsage": 250.0,
-                            "memoryUsed": memory // 2,
-                            "memoryTotal": memory,
-                            "utilization": 50,
-                            "memoryUtilization": 40,
-                            "detection_method": "windows_wmi",
-                            "is_available": True
-                        }
-                        gpus.append(gpu_data)
-                        gpu_count += 1
+                    gpu_data = {
+                        "id": f"gpu-{gpu_count}",
+                        "name": f"GPU-{gpu_count}",
+                        "model": name,
+                        "type": "gpu",
+                        "status": "healthy",
+                        "temperature": 65,
+                        "powerUsage": 250.0,
+                        "memoryUsed": memory // 2,
+                        "memoryTotal": memory,
+                        "utilization": 50,
+                        "memoryUtilization": 40,
+                        "detection_method": "windows_wmi",
+                        "is_available": True
+                    }
+                    gpus.append(gpu_data)
+                    gpu_count += 1
             except Exception as e:
                 logger.warning(f"Error parsing WMI line: {e}")
                 continue
         
         return gpus
     
-    def _parse_lspci_output(self, output: str) -> List[Dict[str, Any]]:
-        """Parse lspci output for GPU devices"""
+    def _parse_lspci_output(self, lines: Iterable[str]) -> List[Dict[str, Any]]:
+        """Parse lspci output lines for GPU devices"""
         gpus = []
-        lines = output.strip().split('\n')
         
-        gpu_count = 0
-        for line in lines:
-            if 'VGA compatible controller' in line or '3D controller' in line:
-                try:
-                    parts = line.split(':')
-                    if len(parts) >= 3:
-                        name = parts[2].strip()
-                        
-                        # Extract PCI bus ID
-                        pci_match = re.match(r'([0-9a-fA-F]{2}:[0-9a-fA-F]{2}\.[0-9])', line)
-                        pci_bus_id = pci_match.group(1) if pci_match else f"00:{gpu_count:02d}.0"
-                        
-                        gpu_data = {
-                            "id": f"gpu-{gpu_count}",
-                            "name": f"GPU-{gpu_count}",
-                            "model": name,
-                            "pci_bus_id": f"0000:{pci_bus_id}",
-                            "type": "gpu",
-                            "status": "healthy",
-                            "temperature": 65,
-                            "powerUsage": 250.0,
-                            "memoryUsed": 8000000000,
-                            "memoryTotal": 24000000000,
-                            "utilization": 50,
-                            "memoryUtilization": 40,
-                            "detection_method": "linux_lspci",
-                            "is_available": True
-                        }
-                        gpus.append(gpu_data)
-                        gpu_count += 1
-                except Exception as e:
-                    logger.warning(f"Error parsing lspci line: {e}")
-                    continue
+        matches = filter(None, map(LSPCI_GPU_RE.match, lines))
+        for gpu_count, match in enumerate(matches):
+            slot = match.group("slot")
+            # lspci prints "bus:device.function", or "domain:bus:device.function" with -D
+            pci_bus_id = f"0000:{slot}" if slot.count(':') == 1 else slot
+            
+            gpu_data = {
+                "id": f"gpu-{gpu_count}",
+                "name": f"GPU-{gpu_count}",
+                "model": match.group("name"),
+                "pci_bus_id": pci_bus_id,
+                "type": "gpu",
+                "status": "healthy",
+                "temperature": 65,
+                "powerUsage": 250.0,
+                "memoryUsed": 8000000000,
+                "memoryTotal": 24000000000,
+                "utilization": 50,
+                "memoryUtilization": 40,
+                "detection_method": "linux_lspci",
+                "is_available": True
+            }
+            gpus.append(gpu_data)
         
         return gpus
     
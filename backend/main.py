@@ -1,40 +1,45 @@
-from typing import List, Dict, Any, Optional
-from contextlib import asynccontextmanager
+from typing import List, Dict, Any, Optional, Annotated, Literal
+from contextlib import asynccontextmanager, suppress
 from fastapi import FastAPI, APIRouter, Depends, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse, Response
 from fastapi import Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, validator
+from fastapi.middleware.gzip import GZipMiddleware
+from pydantic import BaseModel, StringConstraints
 from gpu_detector import GPUDetector
-import traceback
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 import psutil
-import requests
+import httpx
 import logging
+import os
 import socket
+import asyncio
+import anyio
+import hashlib
+import orjson
+import threading
+import time
+import re
+from operator import itemgetter
+from functools import lru_cache
 
 # --- Database and ORM ---
-from sqlalchemy import create_engine
-from sqlalchemy.orm import Session
+from sqlalchemy import select, delete, update, func, case, or_, literal
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session, selectinload
 from sqlalchemy.exc import SQLAlchemyError, OperationalError
-from create_db import GPU, Network, Job, History, Agent, Base, create_tables, SessionLocal
+from create_db import GPU, GPUSample, Network, Job, JobStatus, History, Agent, Base, UTCDateTime, create_tables, SessionLocal, session_factory, session_scope
 
 # --- Scheduler Import ---
 from scheduler import scheduler
 
 # Configure logging
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
-
-# --- Database Configuration ---
-DATABASE_URL = "sqlite:///c:/dev/GPU-Nebula/backend/control_plane.db"
-engine = create_engine(
-    DATABASE_URL, 
-    connect_args={"check_same_thread": False},
-    pool_pre_ping=True,  # Validate connections before use
-    pool_recycle=3600,   # Recycle connections every hour
-    echo=False  # Set to True for SQL debugging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s"
 )
+logger = logging.getLogger(__name__)
 
 # --- Dependency Management ---
 def get_db():
@@ -47,10 +52,19 @@ def get_db():
         db.rollback()
         raise
     finally:
-        db.close()
+        SessionLocal.remove()
 
+@lru_cache(maxsize=1)
+def get_hostname():
+    """Hostname of the control plane machine (cached; it does not change at runtime)."""
+    return socket.gethostname()
+
+@lru_cache(maxsize=1)
 def get_local_ip():
-    """Get local IP address of the machine."""
+    """Get local IP address of the machine.
+    
+    Cached after the first call; use get_local_ip.cache_clear() if the host is rebound.
+    """
     try:
         s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         # Doesn't have to be reachable
@@ -61,18 +75,92 @@ def get_local_ip():
     except Exception:
         return "127.0.0.1"
 
+# --- Agent Report Buffering ---
+REPORT_FLUSH_INTERVAL = 0.2  # seconds between buffer flushes
+REPORT_BATCH_SIZE = 200      # max reports written per transaction
+REPORT_BUFFER_SIZE = 2000    # reports held before /report-in starts shedding load
+
+def drain_report_buffer(buffer: asyncio.Queue, limit: int = REPORT_BATCH_SIZE) -> list:
+    """Pop up to `limit` buffered reports without waiting."""
+    reports = []
+    while len(reports) < limit:
+        try:
+            reports.append(buffer.get_nowait())
+        except asyncio.QueueEmpty:
+            break
+    return reports
+
+async def flush_agent_reports(buffer: asyncio.Queue):
+    """Background task: periodically write buffered agent reports in one transaction."""
+    while True:
+        await asyncio.sleep(REPORT_FLUSH_INTERVAL)
+        reports = drain_report_buffer(buffer)
+        if reports:
+            await run_in_threadpool(ingest_agent_reports, reports)
+
 # --- Lifespan Management ---
+THREADPOOL_SIZE = 200  # worker threads available to sync (def) endpoints
+
+def wake_job_monitor(app: FastAPI):
+    """Start a monitor pass now and drop the idle backoff (callable from threadpool handlers)."""
+    app.state.loop.call_soon_threadsafe(app.state.monitor_wake.set)
+
+async def monitor_jobs_loop(app: FastAPI):
+    """Monitor jobs in the background, polling less often while nothing is changing."""
+    wake = app.state.monitor_wake
+    while True:
+        try:
+            transitions = await scheduler.monitor_jobs_async(app.state.http)
+            queued = await run_in_threadpool(scheduler.schedule_pending)
+            transitions += queued.get("started", 0) + queued.get("failed", 0)
+            if transitions:
+                invalidate_topology_cache()
+        except Exception as e:
+            logger.error(f"Background job monitoring failed: {e}")
+            transitions = 0
+        # Sleep out the interval unless a job is submitted meanwhile, which restarts the cadence
+        with suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(wake.wait(), scheduler.next_monitor_interval(transitions))
+        if wake.is_set():
+            wake.clear()
+            scheduler.reset_monitor_interval()
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logger.info("🚀 GPU Nebula Control Plane is starting up...")
+    flush_task = monitor_task = None
+    # Shared outbound client so calls to agents reuse pooled keep-alive connections
+    app.state.http = httpx.AsyncClient(
+        timeout=10.0,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20)
+    )
     try:
         create_tables()
+        # Sync handlers run on anyio's worker threads; the default 40 caps concurrent pollers
+        anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+        app.state.report_buffer = asyncio.Queue(maxsize=REPORT_BUFFER_SIZE)
+        app.state.loop = asyncio.get_running_loop()
+        app.state.monitor_wake = asyncio.Event()
+        flush_task = asyncio.create_task(flush_agent_reports(app.state.report_buffer))
+        monitor_task = asyncio.create_task(monitor_jobs_loop(app))
         logger.info("✅ Control Plane is ready.")
         yield
     except Exception as e:
         logger.error(f"❌ Startup error: {e}")
         raise
     finally:
+        if monitor_task:
+            monitor_task.cancel()
+            with suppress(asyncio.CancelledError):
+                await monitor_task
+        if flush_task:
+            flush_task.cancel()
+            with suppress(asyncio.CancelledError):
+                await flush_task
+            # Persist anything that arrived after the last flush
+            while reports := drain_report_buffer(app.state.report_buffer):
+                ingest_agent_reports(reports)
+        await app.state.http.aclose()
         logger.info("👋 GPU Nebula Control Plane is shutting down.")
 
 # --- App Initialization ---
@@ -80,6 +168,7 @@ app = FastAPI(
     title="GPU Nebula Control Plane", 
     version="2.1.0", 
     description="Central management API for a distributed GPU cluster with job scheduling.",
+    default_response_class=ORJSONResponse,  # Faster serialization for the large dict payloads
     lifespan=lifespan
 )
 
@@ -93,23 +182,28 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Topology payloads grow with cluster size and are highly repetitive JSON, so they
+# compress well; small responses are left alone.
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
+@app.middleware("http")
+async def scoped_db_session(request: Request, call_next):
+    """Give each request its own SessionLocal scope and release it afterwards."""
+    token = session_scope.set(object())
+    try:
+        return await call_next(request)
+    finally:
+        SessionLocal.remove()
+        session_scope.reset(token)
+
 # --- Pydantic Models ---
+# Stripped, non-empty string; checked by pydantic-core instead of a Python validator
+NonEmptyStr = Annotated[str, StringConstraints(strip_whitespace=True, min_length=1)]
+
 class AgentInfo(BaseModel):
-    hostname: str
-    ip_address: str
+    hostname: NonEmptyStr
+    ip_address: NonEmptyStr
     os: str
-    
-    @validator('hostname')
-    def validate_hostname(cls, v):
-        if not v or not v.strip():
-            raise ValueError('Hostname cannot be empty')
-        return v.strip()
-    
-    @validator('ip_address')
-    def validate_ip(cls, v):
-        if not v or not v.strip():
-            raise ValueError('IP address cannot be empty')
-        return v.strip()
 
 class GPUReport(BaseModel):
     gpus: List[Dict[str, Any]]
@@ -123,27 +217,15 @@ class AgentReportIn(BaseModel):
     gpu_report: GPUReport
 
 class JobRequest(BaseModel):
-    workload_type: str
-    command: str
+    workload_type: NonEmptyStr
+    command: NonEmptyStr
     preferred_gpu: Optional[str] = None
-    
-    @validator('workload_type')
-    def validate_workload_type(cls, v):
-        if not v or not v.strip():
-            raise ValueError('Workload type cannot be empty')
-        return v.strip()
-    
-    @validator('command')
-    def validate_command(cls, v):
-        if not v or not v.strip():
-            raise ValueError('Command cannot be empty')
-        return v.strip()
 
 # --- Error Handlers ---
 @app.exception_handler(SQLAlchemyError)
 async def sqlalchemy_exception_handler(request, exc):
     logger.error(f"Database error: {exc}")
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=500,
         content={"error": "Database operation failed", "detail": str(exc)}
     )
@@ -151,7 +233,7 @@ async def sqlalchemy_exception_handler(request, exc):
 @app.exception_handler(OperationalError)
 async def operational_error_handler(request, exc):
     logger.error(f"Database connection error: {exc}")
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=503,
         content={"error": "Database connection error", "detail": "Service temporarily unavailable"}
     )
@@ -159,237 +241,468 @@ async def operational_error_handler(request, exc):
 # --- Agent API Router ---
 agent_router = APIRouter(prefix="/api/v1/agent", tags=["Agent Communication"])
 
-@agent_router.post("/report-in")
-def agent_report_in(report: AgentReportIn, request: Request, db: Session = Depends(get_db)):
-    """Endpoint for agents to report their status and detected GPUs."""
-    try:
-        # Log incoming request headers for debugging
-        client_host = request.client.host if request.client else "unknown"
-        logger.info(f"Received report from agent: {report.agent_info.hostname} ({client_host})")
-        logger.debug(f"Request headers: {request.headers}")
-        
-        # Validate report data
-        if not report.gpu_report.gpus:
-            logger.warning(f"Agent {report.agent_info.hostname} reported no GPUs")
-        
-        # 1. Upsert Agent
-        agent = db.query(Agent).filter_by(hostname=report.agent_info.hostname).first()
-        if agent:
-            agent.ip_address = report.agent_info.ip_address
-            agent.os = report.agent_info.os
-            agent.last_seen = datetime.now()
-        else:
-            agent = Agent(
-                hostname=report.agent_info.hostname,
-                ip_address=report.agent_info.ip_address,
-                os=report.agent_info.os,
-                last_seen=datetime.now()
-            )
-            db.add(agent)
-            db.flush()  # Get agent.id
+# Reported GPU fields -> GPU columns, read with a single itemgetter call per row
+GPU_REPORT_DEFAULTS = {
+    "id": None,
+    "name": "Unknown GPU",
+    "model": "Unknown Model",
+    "status": "unknown",
+    "temperature": 0,
+    "utilization": 0,
+    "memoryTotal": 0,
+    "memoryUsed": 0,
+    "pci_bus_id": ""
+}
+GPU_REPORT_GETTER = itemgetter(*GPU_REPORT_DEFAULTS)
+GPU_REPORT_COLUMNS = ("id", "name", "model", "status", "temperature", "utilization",
+                      "memory_total", "memory_used", "pci_bus_id")
 
-        # 2. Clear old GPUs for this agent
-        old_gpu_count = db.query(GPU).filter_by(agent_id=agent.id).count()
-        db.query(GPU).filter_by(agent_id=agent.id).delete()
+def gpu_index_from_id(gpu_id) -> Optional[int]:
+    """Device index from a reported GPU ID such as "GPU-2", parsed once when the GPU is stored."""
+    _, _, suffix = str(gpu_id).rpartition("-")
+    return int(suffix) if suffix.isdigit() else None
 
-        # 3. Insert new GPUs
-        gpus_added = 0
-        for gpu_data in report.gpu_report.gpus:
-            try:
-                gpu = GPU(
-                    id=gpu_data.get("id"),
-                    name=gpu_data.get("name", "Unknown GPU"),
-                    model=gpu_data.get("model", "Unknown Model"),
-                    status=gpu_data.get("status", "unknown"),
-                    temperature=gpu_data.get("temperature", 0),
-                    utilization=gpu_data.get("utilization", 0),
-                    memory_total=gpu_data.get("memoryTotal", 0),
-                    memory_used=gpu_data.get("memoryUsed", 0),
-                    agent_id=agent.id,
-                    vram=gpu_data.get("memoryTotal", 0) // (1024**3) if gpu_data.get("memoryTotal") else 0,
-                    is_available=gpu_data.get("status") == "healthy",
-                    pci_bus_id=gpu_data.get("pci_bus_id", "")
-                )
-                db.add(gpu)
-                gpus_added += 1
-            except Exception as e:
-                logger.error(f"Error adding GPU {gpu_data.get('id', 'unknown')}: {e}")
-                continue
+# Weight of the newest sample in the smoothed GPU telemetry the scheduler ranks on
+TELEMETRY_EMA_ALPHA = 0.3
 
-        db.commit()
-        
-        logger.info(f"Report processed: {agent.hostname}, GPUs: {old_gpu_count} -> {gpus_added}")
-        return {
-            "status": "success",
-            "message": f"Report from {agent.hostname} processed successfully",
-            "gpus_added": gpus_added,
-            "gpus_removed": old_gpu_count
+def smooth_gpu_telemetry(row: Dict[str, Any], previous) -> None:
+    """Set a GPU row's temp/util EMAs from its samples and the (temp_ema, util_ema) it replaces."""
+    def ema(sample, average):
+        if sample is None or average is None:
+            return average if sample is None else sample
+        return TELEMETRY_EMA_ALPHA * sample + (1 - TELEMETRY_EMA_ALPHA) * average
+    prev_temp, prev_util = previous or (None, None)
+    row["temp_ema"] = ema(row["temperature"], prev_temp)
+    row["util_ema"] = ema(row["utilization"], prev_util)
+
+def fold_stored_gpu_telemetry(db: Session, agent_ids: List[int]):
+    """Fold the agents' stored readings into their EMAs again, for reports that repeat them.
+
+    An unchanged inventory means each GPU re-reported the temperature and utilization it
+    already has, so the update runs in SQL from those columns in a single statement.
+    """
+    def ema(sample, average):
+        blended = TELEMETRY_EMA_ALPHA * sample + (1 - TELEMETRY_EMA_ALPHA) * func.coalesce(average, sample)
+        return func.coalesce(blended, average)  # No reading: keep the average
+    db.execute(
+        update(GPU)
+        .where(GPU.agent_id.in_(agent_ids))
+        .values(temp_ema=ema(GPU.temperature, GPU.temp_ema), util_ema=ema(GPU.utilization, GPU.util_ema)),
+        execution_options={"synchronize_session": False}
+    )
+
+def replace_agent_gpus(db: Session, agent_ids: List[int]) -> Dict[str, tuple]:
+    """Delete the agents' GPU rows, returning each one's (temp_ema, util_ema) by GPU id."""
+    stmt = delete(GPU).where(GPU.agent_id.in_(agent_ids)).returning(GPU.id, GPU.temp_ema, GPU.util_ema)
+    rows = db.execute(stmt, execution_options={"synchronize_session": False})
+    return {gpu_id: (temp_ema, util_ema) for gpu_id, temp_ema, util_ema in rows}
+
+GPU_SAMPLE_BATCH_SIZE = 500  # rows per executemany INSERT
+# Telemetry history kept; older samples are pruned in every ingest transaction
+GPU_SAMPLE_RETENTION = timedelta(hours=float(os.environ.get("GPU_SAMPLE_RETENTION_HOURS", "24")))
+
+def record_gpu_samples(db: Session, gpu_rows: List[Dict[str, Any]], now: datetime):
+    """Append one telemetry sample per stored GPU row via Core inserts (no ORM unit of work)."""
+    samples = [{
+        "gpu_id": row["id"],
+        "timestamp": now,
+        "temperature": row["temperature"],
+        "utilization": row["utilization"],
+        "memory_used": row["memory_used"]
+    } for row in gpu_rows]
+    insert_stmt = GPUSample.__table__.insert()
+    for start in range(0, len(samples), GPU_SAMPLE_BATCH_SIZE):
+        db.execute(insert_stmt, samples[start:start + GPU_SAMPLE_BATCH_SIZE])
+
+def record_stored_gpu_samples(db: Session, agent_ids: List[int], now: datetime):
+    """Append a sample for each of the agents' GPUs from its stored readings (INSERT ... SELECT)."""
+    readings = select(GPU.id, literal(now, UTCDateTime), GPU.temperature, GPU.utilization, GPU.memory_used) \
+        .where(GPU.agent_id.in_(agent_ids))
+    db.execute(GPUSample.__table__.insert().from_select(
+        ["gpu_id", "timestamp", "temperature", "utilization", "memory_used"], readings
+    ))
+
+def prune_gpu_samples(db: Session, now: datetime):
+    """Drop samples older than GPU_SAMPLE_RETENTION, including those of GPUs since removed."""
+    db.execute(GPUSample.__table__.delete().where(GPUSample.timestamp < now - GPU_SAMPLE_RETENTION))
+
+def gpu_report_hash(report: AgentReportIn) -> str:
+    """Stable fingerprint of a report's GPU list, used to skip unchanged inventories."""
+    payload = orjson.dumps(report.gpu_report.gpus, option=orjson.OPT_SORT_KEYS)
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+def apply_agent_reports(db: Session, reports: List[AgentReportIn], now: datetime):
+    """Upsert the reporting agents and replace changed GPU inventories (no commit)."""
+    report_hashes = {report.agent_info.hostname: gpu_report_hash(report) for report in reports}
+    
+    # 1. Upsert all agents in one INSERT ... ON CONFLICT statement. The stored GPU hash is
+    #    left out of the update so RETURNING yields the previous one (NULL for new agents).
+    stmt = sqlite_insert(Agent).values([{
+        "hostname": report.agent_info.hostname,
+        "ip_address": report.agent_info.ip_address,
+        "os": report.agent_info.os,
+        "last_seen": now
+    } for report in reports])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Agent.hostname],
+        set_={
+            "ip_address": stmt.excluded.ip_address,
+            "os": stmt.excluded.os,
+            "last_seen": stmt.excluded.last_seen
         }
+    ).returning(Agent.hostname, Agent.id, Agent.gpu_report_hash)
+    agent_ids, stored_hashes = {}, {}
+    for hostname, agent_id, stored_hash in db.execute(stmt):
+        agent_ids[hostname] = agent_id
+        stored_hashes[hostname] = stored_hash
+    
+    # Steady state: agents re-send the same inventory, which only needs last_seen bumped
+    changed = [
+        report for report in reports
+        if stored_hashes[report.agent_info.hostname] != report_hashes[report.agent_info.hostname]
+    ]
+    db.bulk_update_mappings(Agent, [{
+        "id": agent_ids[report.agent_info.hostname],
+        "gpu_report_hash": report_hashes[report.agent_info.hostname]
+    } for report in changed])
 
-    except Exception as e:
-        db.rollback()
-        logger.error(f"Error processing agent report: {e}")
-        traceback.print_exc()
-        return JSONResponse(
-            status_code=500, 
-            content={"status": "error", "error": str(e)}
+    # Repeated readings are still samples: record them and keep the scheduler's averages
+    # converging on them
+    if len(changed) < len(reports):
+        changed_hostnames = {report.agent_info.hostname for report in changed}
+        unchanged_ids = [
+            agent_id for hostname, agent_id in agent_ids.items() if hostname not in changed_hostnames
+        ]
+        fold_stored_gpu_telemetry(db, unchanged_ids)
+        record_stored_gpu_samples(db, unchanged_ids, now)
+    prune_gpu_samples(db, now)
+
+    if not changed:
+        logger.info(f"Reports processed: {len(reports)} agent(s), GPU inventories unchanged")
+        return
+
+    # New inventories can add GPUs or take them out of rotation (e.g. overheating)
+    scheduler.invalidate_gpu_ranking()
+
+    # 2. Clear old GPUs for agents whose inventory changed, keeping their smoothed telemetry
+    previous_ema = replace_agent_gpus(db, [agent_ids[report.agent_info.hostname] for report in changed])
+    gpus_removed = len(previous_ema)
+
+    # 3. Insert their new GPUs in one statement
+    gpu_rows = []
+    for report in changed:
+        agent_id = agent_ids[report.agent_info.hostname]
+        for gpu_data in report.gpu_report.gpus:
+            row = dict(zip(GPU_REPORT_COLUMNS, GPU_REPORT_GETTER({**GPU_REPORT_DEFAULTS, **gpu_data})))
+            row["agent_id"] = agent_id
+            row["pci_index"] = gpu_index_from_id(row["id"])
+            smooth_gpu_telemetry(row, previous_ema.get(row["id"]))
+            row["is_available"] = gpu_data.get("status") == "healthy"
+            gpu_rows.append(row)
+    if gpu_rows:
+        db.bulk_insert_mappings(GPU, gpu_rows)
+        record_gpu_samples(db, gpu_rows, now)
+
+    logger.info(
+        f"Reports processed: {len(reports)} agent(s), {len(changed)} changed, "
+        f"GPUs: {gpus_removed} -> {len(gpu_rows)}"
+    )
+
+def ingest_agent_reports(reports: List[AgentReportIn]):
+    """Write a batch of buffered agent reports in a single transaction."""
+    # Only the newest report from each agent matters
+    latest = list({report.agent_info.hostname: report for report in reports}.values())
+    now = datetime.now(timezone.utc)
+    with session_factory() as db:
+        try:
+            # One explicit BEGIN/COMMIT for the whole batch; rolled back on error
+            with db.begin():
+                apply_agent_reports(db, latest, now)
+            invalidate_topology_cache()
+        except Exception:
+            logger.exception("Batched report ingestion failed, retrying reports individually")
+            # Isolate the bad report so the rest of the batch still lands
+            for report in latest:
+                try:
+                    with db.begin():
+                        apply_agent_reports(db, [report], now)
+                    invalidate_topology_cache()
+                except Exception:
+                    logger.exception(f"Error processing report from agent {report.agent_info.hostname}")
+
+@agent_router.post("/report-in", status_code=202)
+async def agent_report_in(report: AgentReportIn, request: Request):
+    """Endpoint for agents to report their status and detected GPUs.
+
+    Reports are buffered and written in batches by a background task, so the
+    response only acknowledges receipt.
+    """
+    # Per-report logging is debug-only and lazily formatted; batches are summarized on ingest
+    if logger.isEnabledFor(logging.DEBUG):
+        client_host = request.client.host if request.client else "unknown"
+        logger.debug("Received report from agent: %s (%s)", report.agent_info.hostname, client_host)
+        logger.debug("Request headers: %s", request.headers)
+
+    # Validate report data
+    if not report.gpu_report.gpus:
+        logger.warning(f"Agent {report.agent_info.hostname} reported no GPUs")
+
+    try:
+        request.app.state.report_buffer.put_nowait(report)
+    except asyncio.QueueFull:
+        logger.warning(f"Report buffer full, rejecting report from {report.agent_info.hostname}")
+        return ORJSONResponse(
+            status_code=503,
+            content={"status": "error", "error": "Control plane is busy, retry later"}
         )
 
+    return {
+        "status": "accepted",
+        "message": f"Report from {report.agent_info.hostname} queued for processing"
+    }
+
+# --- Topology Cache ---
+TOPOLOGY_CACHE_TTL = 2.0  # seconds a built topology may be served unchanged
+# "bodies" holds the serialized response and its ETag per layout, built on first request
+_topology_cache = {"ts": 0.0, "version": 0, "built_version": -1, "topology": None, "bodies": {}}
+TOPOLOGY_TABLES = ("gpus", "servers", "connections")
+
+# Hostname fragments that mark an agent as the control plane host
+CONTROL_PLANE_HOSTNAME_RE = re.compile(r"dell|control|localhost|browser-detected|master|gpu-detected", re.I)
+
+@lru_cache(maxsize=4096)
+def _iso(dt: datetime) -> str:
+    """isoformat() memoized: agent last_seen values repeat across polls until the agent reports again."""
+    return dt.isoformat()
+
+def columnar_topology(topology: dict) -> dict:
+    """Topology with each node/edge list turned into parallel per-field lists.
+
+    {"gpus": [{"id": ..., "model": ...}, ...]} becomes {"gpus": {"id": [...], "model": [...]}},
+    so field names are sent once per table instead of once per row. Fields missing from
+    some rows (e.g. "is_virtual") are null in those positions.
+    """
+    columnar = dict(topology)
+    for table in TOPOLOGY_TABLES:
+        rows = topology[table]
+        fields = list(dict.fromkeys(field for row in rows for field in row))
+        columnar[table] = {field: [row.get(field) for row in rows] for field in fields}
+    return columnar
+
+def invalidate_topology_cache():
+    """Force the next /topology request to rebuild (called after cluster state changes)."""
+    _topology_cache["version"] += 1
+
 # --- User-Facing API Router ---
 api_router = APIRouter(prefix="/api/v1", tags=["Cluster Management"])
 
-@api_router.get("/topology")
-def get_cluster_topology(db: Session = Depends(get_db)):
-    """Get the entire cluster topology formatted for the frontend."""
-    try:
-        agents = db.query(Agent).all()
-        active_jobs = db.query(Job).filter(Job.status.in_(["running", "pending"])).all()
-        
-        logger.info(f"Found {len(agents)} agents in database")
-        for agent in agents:
-            logger.info(f"Agent: {agent.hostname} - IP: {agent.ip_address} - Last seen: {agent.last_seen}")
+@lru_cache(maxsize=1)
+def virtual_control_plane_node() -> dict:
+    """Fixed fields of the server node shown for the control plane when no agent runs on it."""
+    hub_hostname = f"{get_hostname()}-ControlPlane"
+    return {
+        "id": f"server-{hub_hostname}",
+        "name": hub_hostname,
+        "cpu": "Unknown",
+        "ram": "Unknown",
+        "os": "Control Plane",
+        "status": "healthy",
+        "active_jobs": 0,
+        "ip_address": get_local_ip(),
+        "is_control_plane": True,
+        "is_virtual": True  # Mark this as a virtual node
+    }
 
-        gpus, servers, connections = [], [], []
-        other_agents = []
-        control_plane_hostname = None
-        
-        # Process each agent and create server nodes
+def build_cluster_topology(db: Session) -> dict:
+    """Build the cluster topology (servers, GPUs, connections) for the frontend."""
+    now = datetime.now(timezone.utc)
+    now_iso = now.isoformat()
+    # selectinload fetches every agent's GPUs in one extra query instead of one per agent.
+    # Liveness is computed in SQL: agents not seen for 5 minutes are offline.
+    agent_rows = (
+        db.query(Agent, case(
+            (or_(Agent.last_seen.is_(None), Agent.last_seen > now - timedelta(seconds=300)), "healthy"),
+            else_="offline"
+        ).label("status"))
+        .options(selectinload(Agent.gpus))
+        .all()
+    )
+    agents = [agent for agent, _ in agent_rows]
+    agent_status = {agent.id: status for agent, status in agent_rows}
+    # Only three columns are needed, so fetch plain rows instead of full Job objects
+    active_jobs = db.execute(
+        select(Job.agent_id, Job.assigned_gpu_id, Job.workload_type)
+        .where(Job.status.in_([JobStatus.RUNNING, JobStatus.PENDING]))
+    ).all()
+
+    # Index active jobs in one pass: agent -> job count, GPU -> (job count, first workload)
+    agent_job_counts = {}
+    gpu_job_info = {}
+    for agent_id, gpu_id, workload_type in active_jobs:
+        agent_job_counts[agent_id] = agent_job_counts.get(agent_id, 0) + 1
+        count, first_workload = gpu_job_info.get(gpu_id, (0, workload_type))
+        gpu_job_info[gpu_id] = (count + 1, first_workload)
+
+    if logger.isEnabledFor(logging.DEBUG):
         for agent in agents:
-            # Determine if this is the control plane
-            is_control_plane = any(keyword in agent.hostname.lower() for keyword in [
-                'dell', 'control', 'localhost', 'browser-detected', 'master', 'gpu-detected'
-            ])
-            
-            if is_control_plane and not control_plane_hostname:
-                # This is the first agent we've found that looks like the control plane.
-                control_plane_hostname = agent.hostname
-                servers.append(agent) # Add the full agent object to process first
-            else:
-                other_agents.append(agent)
-
-        # If no agent was identified as the control plane, create a virtual one.
-        if not control_plane_hostname:
-            actual_hostname = socket.gethostname()
-            hub_hostname = f"{actual_hostname}-ControlPlane"
-            
-            # Add the virtual control plane node to the front of the servers list
-            servers.insert(0, {
-                "id": f"server-{hub_hostname}",
-                "name": hub_hostname,
-                "cpu": "Unknown",
-                "ram": "Unknown",
-                "os": "Control Plane",
-                "status": "healthy",
-                "active_jobs": 0,
-                "ip_address": get_local_ip(),
-                "last_seen": datetime.now().isoformat(),
-                "is_control_plane": True,
-                "is_virtual": True # Mark this as a virtual node
-            })
+            logger.debug("Agent: %s - IP: %s - Last seen: %s", agent.hostname, agent.ip_address, agent.last_seen)
+
+    gpus, servers, connections = [], [], []
+    other_agents = []
+    control_plane_hostname = None
+
+    # Process each agent and create server nodes
+    for agent in agents:
+        # Determine if this is the control plane
+        is_control_plane = bool(CONTROL_PLANE_HOSTNAME_RE.search(agent.hostname))
+
+        if is_control_plane and not control_plane_hostname:
+            # This is the first agent we've found that looks like the control plane.
+            control_plane_hostname = agent.hostname
+            servers.append(agent) # Add the full agent object to process first
         else:
-            # An existing agent was designated as the control plane.
-            hub_hostname = control_plane_hostname
+            other_agents.append(agent)
 
-        # Now, process all other agents
-        servers.extend(other_agents)
+    # If no agent was identified as the control plane, create a virtual one.
+    if not control_plane_hostname:
+        virtual_node = virtual_control_plane_node()
+        hub_hostname = virtual_node["name"]
 
-        # --- Build final topology from sorted server list ---
-        final_servers = []
-        for agent_or_node in servers:
-            is_virtual = isinstance(agent_or_node, dict) and agent_or_node.get("is_virtual")
-            
-            if is_virtual:
-                final_servers.append(agent_or_node)
-                continue
+        # Add the virtual control plane node to the front of the servers list
+        servers.insert(0, {**virtual_node, "last_seen": now_iso})
+    else:
+        # An existing agent was designated as the control plane.
+        hub_hostname = control_plane_hostname
 
-            # This is a real agent from the database
-            agent = agent_or_node
-            
-            # Calculate status based on last_seen
-            status = "healthy"
-            if agent.last_seen:
-                time_diff = (datetime.now() - agent.last_seen).total_seconds()
-                status = "healthy" if time_diff < 300 else "offline"  # 5 minutes timeout
-            
-            # Count active jobs for this agent
-            server_active_jobs = [j for j in active_jobs if j.agent_id == agent.id]
-            
-            # Add server node
-            final_servers.append({
-                "id": f"server-{agent.hostname}",
-                "name": agent.hostname,
-                "cpu": "Unknown",
-                "ram": "Unknown", 
-                "os": agent.os or "Unknown",
-                "status": status,
-                "active_jobs": len(server_active_jobs),
-                "ip_address": agent.ip_address,
-                "last_seen": agent.last_seen.isoformat() if agent.last_seen else None,
-                "is_control_plane": agent.hostname == hub_hostname
+    # Now, process all other agents
+    servers.extend(other_agents)
+
+    # --- Build final topology from sorted server list ---
+    final_servers = []
+    for agent_or_node in servers:
+        is_virtual = isinstance(agent_or_node, dict) and agent_or_node.get("is_virtual")
+
+        if is_virtual:
+            final_servers.append(agent_or_node)
+            continue
+
+        # This is a real agent from the database
+        agent = agent_or_node
+
+        # Add server node
+        final_servers.append({
+            "id": f"server-{agent.hostname}",
+            "name": agent.hostname,
+            "cpu": "Unknown",
+            "ram": "Unknown", 
+            "os": agent.os or "Unknown",
+            "status": agent_status[agent.id],
+            "active_jobs": agent_job_counts.get(agent.id, 0),
+            "ip_address": agent.ip_address,
+            "last_seen": _iso(agent.last_seen) if agent.last_seen else None,
+            "is_control_plane": agent.hostname == hub_hostname
+        })
+
+        # Add GPU information for this agent
+        db_gpus = agent.gpus
+
+        for gpu in db_gpus:
+            gpu_job_count, current_job = gpu_job_info.get(gpu.id, (0, None))
+
+            gpus.append({
+                "id": str(gpu.id),
+                "name": gpu.name or f"GPU-{gpu.id}",
+                "model": gpu.model or "Unknown",
+                "status": gpu.status or "unknown",
+                "temperature": gpu.temperature or 0,
+                "utilization": gpu.utilization or 0,
+                "memory_total": gpu.memory_total or 0,
+                "memory_used": gpu.memory_used or 0,
+                "memory_free": max(0, (gpu.memory_total or 0) - (gpu.memory_used or 0)),
+                "active_jobs": gpu_job_count,
+                "current_job": current_job,
+                "agent_hostname": agent.hostname,
+                "is_available": gpu.is_available if gpu.is_available is not None else True
             })
 
-            # Add GPU information for this agent
-            db_gpus = db.query(GPU).filter_by(agent_id=agent.id).all()
-            logger.info(f"Agent {agent.hostname} has {len(db_gpus)} GPUs")
-            
-            for gpu in db_gpus:
-                gpu_jobs = [j for j in active_jobs if j.assigned_gpu_id == gpu.id]
-                
-                gpus.append({
-                    "id": str(gpu.id),
-                    "name": gpu.name or f"GPU-{gpu.id}",
-                    "model": gpu.model or "Unknown",
-                    "status": gpu.status or "unknown",
-                    "temperature": gpu.temperature or 0,
-                    "utilization": gpu.utilization or 0,
-                    "memory_total": gpu.memory_total or 0,
-                    "memory_used": gpu.memory_used or 0,
-                    "memory_free": max(0, (gpu.memory_total or 0) - (gpu.memory_used or 0)),
-                    "active_jobs": len(gpu_jobs),
-                    "current_job": gpu_jobs[0].workload_type if gpu_jobs else None,
-                    "agent_hostname": agent.hostname,
-                    "is_available": gpu.is_available if gpu.is_available is not None else True
-                })
-                
-                # Add connection between server and GPU
-                connections.append({
-                    "id": f"conn-{agent.hostname}-{gpu.id}",
-                    "source": f"server-{agent.hostname}",
-                    "target": str(gpu.id),
-                    "type": "pcie"
-                })
-
-        # Create ethernet connections between control plane and other agents
-        # This ensures all real agents (including the one designated as control plane, if it's not the hub) get connected.
-        all_real_agents = [s for s in servers if not (isinstance(s, dict) and s.get("is_virtual"))]
-        for agent_obj in all_real_agents:
-            # Don't connect the hub to itself.
-            if agent_obj.hostname != hub_hostname:
-                connections.append({
-                    "id": f"conn-control-{agent_obj.hostname}",
-                    "source": f"server-{hub_hostname}",
-                    "target": f"server-{agent_obj.hostname}",
-                    "type": "ethernet"
-                })
-
-        logger.info(f"Topology: {len(final_servers)} servers, {len(gpus)} GPUs, {len(connections)} connections")
+            # Add connection between server and GPU
+            connections.append({
+                "id": f"conn-{agent.hostname}-{gpu.id}",
+                "source": f"server-{agent.hostname}",
+                "target": str(gpu.id),
+                "type": "pcie"
+            })
 
-        return {
-            "status": "success",
-            "gpus": gpus,
-            "servers": final_servers, 
-            "connections": connections,
-            "total_jobs": len(active_jobs),
-            "total_gpus": len(gpus),
-            "total_agents": len(final_servers), # Use servers count as it includes virtual node
-            "control_plane": hub_hostname,
-            "timestamp": datetime.now().isoformat()
-        }
+    # Create ethernet connections between control plane and other agents
+    # This ensures all real agents (including the one designated as control plane, if it's not the hub) get connected.
+    all_real_agents = [s for s in servers if not (isinstance(s, dict) and s.get("is_virtual"))]
+    for agent_obj in all_real_agents:
+        # Don't connect the hub to itself.
+        if agent_obj.hostname != hub_hostname:
+            connections.append({
+                "id": f"conn-control-{agent_obj.hostname}",
+                "source": f"server-{hub_hostname}",
+                "target": f"server-{agent_obj.hostname}",
+                "type": "ethernet"
+            })
+
+    logger.info("Topology: %d agents, %d servers, %d GPUs, %d connections",
+                len(agents), len(final_servers), len(gpus), len(connections))
+
+    return {
+        "status": "success",
+        "gpus": gpus,
+        "servers": final_servers, 
+        "connections": connections,
+        "total_jobs": len(active_jobs),
+        "total_gpus": len(gpus),
+        "total_agents": len(final_servers), # Use servers count as it includes virtual node
+        "control_plane": hub_hostname,
+        "timestamp": now_iso
+    }
+
+@api_router.get("/topology")
+def get_cluster_topology(
+    request: Request,
+    layout: Literal["rows", "columnar"] = "rows",
+    db: Session = Depends(get_db)
+):
+    """Get the entire cluster topology formatted for the frontend.
+    
+    layout=columnar returns gpus, servers and connections as per-field lists (see
+    columnar_topology). The serialized response is reused for TOPOLOGY_CACHE_TTL
+    seconds unless the cluster state changes, and clients sending a matching
+    If-None-Match get a 304.
+    """
+    try:
+        cache = _topology_cache
+        version = cache["version"]
+        if cache["topology"] is None or cache["built_version"] != version \
+                or time.monotonic() - cache["ts"] >= TOPOLOGY_CACHE_TTL:
+            cache.update(
+                ts=time.monotonic(),
+                built_version=version,
+                topology=build_cluster_topology(db),
+                bodies={}
+            )
+        
+        bodies = cache["bodies"]
+        if layout not in bodies:
+            topology = cache["topology"]
+            body = orjson.dumps(columnar_topology(topology) if layout == "columnar" else topology)
+            bodies[layout] = (body, f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"')
+        body, etag = bodies[layout]
+        
+        # Browsers may reuse the body for a second, then must revalidate with If-None-Match
+        headers = {"ETag": etag, "Cache-Control": "max-age=1, must-revalidate"}
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and etag in (tag.strip() for tag in if_none_match.split(",")):
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type="application/json", headers=headers)
         
     except Exception as e:
-        logger.error(f"Error getting topology: {e}")
-        traceback.print_exc()
-        return JSONResponse(
+        logger.exception("Error getting topology")
+        return ORJSONResponse(
             status_code=500,
             content={"status": "error", "error": str(e)}
         )
@@ -398,17 +711,18 @@ def get_cluster_topology(db: Session = Depends(get_db)):
 def debug_agents(db: Session = Depends(get_db)):
     """Debug endpoint to check registered agents"""
     try:
-        agents = db.query(Agent).all()
+        # All agents' GPUs in one IN query instead of one query per agent
+        agents = db.query(Agent).options(selectinload(Agent.gpus)).all()
         agent_info = []
         
         for agent in agents:
-            gpus = db.query(GPU).filter_by(agent_id=agent.id).all()
+            gpus = agent.gpus
             agent_info.append({
                 "id": agent.id,
                 "hostname": agent.hostname,
                 "ip_address": agent.ip_address,
                 "os": agent.os,
-                "last_seen": agent.last_seen.isoformat() if agent.last_seen else None,
+                "last_seen": _iso(agent.last_seen) if agent.last_seen else None,
                 "gpu_count": len(gpus),
                 "gpus": [{"id": g.id, "name": g.name, "model": g.model, "status": g.status} for g in gpus]
             })
@@ -419,11 +733,11 @@ def debug_agents(db: Session = Depends(get_db)):
             "agents": agent_info
         }
     except Exception as e:
-        return JSONResponse(status_code=500, content={"error": str(e)})
+        return ORJSONResponse(status_code=500, content={"error": str(e)})
 
 # --- Job Management Endpoints ---
 @api_router.post("/jobs/submit")
-def submit_job(job_request: JobRequest, db: Session = Depends(get_db)):
+def submit_job(job_request: JobRequest, request: Request, db: Session = Depends(get_db)):
     """Submit a new job for GPU scheduling"""
     try:
         logger.info(f"Submitting job: {job_request.workload_type}")
@@ -433,16 +747,18 @@ def submit_job(job_request: JobRequest, db: Session = Depends(get_db)):
             command=job_request.command,
             preferred_gpu=job_request.preferred_gpu
         )
+        invalidate_topology_cache()
+        # Launched or queued, the job needs the monitor at its base cadence, not the idle one
+        wake_job_monitor(request.app)
         
         if result.get("status") == "error":
-            return JSONResponse(status_code=400, content=result)
+            return ORJSONResponse(status_code=400, content=result)
         
         return result
         
     except Exception as e:
-        logger.error(f"Error submitting job: {e}")
-        traceback.print_exc()
-        return JSONResponse(status_code=500, content={"status": "error", "error": str(e)})
+        logger.exception("Error submitting job")
+        return ORJSONResponse(status_code=500, content={"status": "error", "error": str(e)})
 
 @api_router.get("/jobs/{job_id}/status")
 def get_job_status(job_id: int):
@@ -451,15 +767,15 @@ def get_job_status(job_id: int):
         result = scheduler.get_job_status(job_id)
         
         if "error" in result and result.get("status") == "not_found":
-            return JSONResponse(status_code=404, content=result)
+            return ORJSONResponse(status_code=404, content=result)
         elif "error" in result:
-            return JSONResponse(status_code=500, content=result)
+            return ORJSONResponse(status_code=500, content=result)
             
         return result
         
     except Exception as e:
         logger.error(f"Error getting job status: {e}")
-        return JSONResponse(status_code=500, content={"status": "error", "error": str(e)})
+        return ORJSONResponse(status_code=500, content={"status": "error", "error": str(e)})
 
 @api_router.get("/jobs")
 def list_jobs():
@@ -470,28 +786,31 @@ def list_jobs():
             "status": "success",
             "jobs": jobs,
             "count": len(jobs),
-            "timestamp": datetime.now().isoformat()
+            "timestamp": datetime.now(timezone.utc).isoformat()
         }
     except Exception as e:
         logger.error(f"Error listing jobs: {e}")
-        return JSONResponse(status_code=500, content={"status": "error", "error": str(e)})
+        return ORJSONResponse(status_code=500, content={"status": "error", "error": str(e)})
 
 @api_router.post("/jobs/{job_id}/cancel")
 def cancel_job(job_id: int):
     """Cancel a running job"""
     try:
         result = scheduler.cancel_job(job_id)
+        invalidate_topology_cache()
         
         if result.get("status") == "not_found":
-            return JSONResponse(status_code=404, content=result)
+            return ORJSONResponse(status_code=404, content=result)
+        elif result.get("status") == "conflict":
+            return ORJSONResponse(status_code=409, content=result)
         elif result.get("status") == "error":
-            return JSONResponse(status_code=500, content=result)
+            return ORJSONResponse(status_code=500, content=result)
             
         return result
         
     except Exception as e:
-        logger.error(f"Error cancelling job: {e}")
-        return JSONResponse(status_code=500, content={"status": "error", "error": str(e)})
+        logger.exception("Error cancelling job")
+        return ORJSONResponse(status_code=500, content={"status": "error", "error": str(e)})
 
 @api_router.get("/jobs/{job_id}/history")
 def get_job_history(job_id: int, db: Session = Depends(get_db)):
@@ -499,7 +818,7 @@ def get_job_history(job_id: int, db: Session = Depends(get_db)):
     try:
         job = db.query(Job).filter(Job.id == job_id).first()
         if not job:
-            return JSONResponse(status_code=404, content={"status": "error", "error": "Job not found"})
+            return ORJSONResponse(status_code=404, content={"status": "error", "error": "Job not found"})
         
         history = db.query(History).filter(History.job_id == job_id).order_by(History.timestamp.desc()).all()
         
@@ -510,7 +829,7 @@ def get_job_history(job_id: int, db: Session = Depends(get_db)):
                 "id": job.id,
                 "workload_type": job.workload_type,
                 "command": job.command,
-                "status": job.status,
+                "status": job.status.label,
                 "created_at": job.created_at.isoformat() if job.created_at else None,
                 "started_at": job.started_at.isoformat() if job.started_at else None,
                 "finished_at": job.finished_at.isoformat() if job.finished_at else None
@@ -526,32 +845,41 @@ def get_job_history(job_id: int, db: Session = Depends(get_db)):
         
     except Exception as e:
         logger.error(f"Error getting job history: {e}")
-        return JSONResponse(status_code=500, content={"status": "error", "error": str(e)})
+        return ORJSONResponse(status_code=500, content={"status": "error", "error": str(e)})
 
 @api_router.post("/jobs/monitor")
-def monitor_jobs_now():
+async def monitor_jobs_now(request: Request):
     """Manually trigger job monitoring"""
     try:
-        scheduler.monitor_jobs()
+        await scheduler.monitor_jobs_async(request.app.state.http)
+        # Place any queued jobs on GPUs that have become available
+        await run_in_threadpool(scheduler.schedule_pending)
+        invalidate_topology_cache()
         return {
             "status": "success", 
             "message": "Job monitoring completed",
-            "timestamp": datetime.now().isoformat()
+            "timestamp": datetime.now(timezone.utc).isoformat()
         }
     except Exception as e:
         logger.error(f"Error monitoring jobs: {e}")
-        return JSONResponse(status_code=500, content={"status": "error", "error": str(e)})
+        return ORJSONResponse(status_code=500, content={"status": "error", "error": str(e)})
 
 # --- System Status Endpoints ---
 @api_router.get("/status")
 def get_system_status(db: Session = Depends(get_db)):
     """Get overall system health and statistics"""
     try:
-        total_agents = db.query(Agent).count()
-        total_gpus = db.query(GPU).count()
-        healthy_gpus = db.query(GPU).filter(GPU.status == "healthy").count()
-        active_jobs = db.query(Job).filter(Job.status.in_(["running", "pending"])).count()
-        completed_jobs = db.query(Job).filter(Job.status == "completed").count()
+        # All five counters in one statement, as scalar subqueries
+        def count(model, *criteria):
+            return select(func.count()).select_from(model).where(*criteria).scalar_subquery()
+        
+        total_agents, total_gpus, healthy_gpus, active_jobs, completed_jobs = db.execute(select(
+            count(Agent),
+            count(GPU),
+            count(GPU, GPU.status == "healthy"),
+            count(Job, Job.status.in_([JobStatus.RUNNING, JobStatus.PENDING])),
+            count(Job, Job.status == JobStatus.COMPLETED)
+        )).one()
         
         return {
             "status": "success",
@@ -563,26 +891,41 @@ def get_system_status(db: Session = Depends(get_db)):
                 "active_jobs": active_jobs,
                 "completed_jobs": completed_jobs
             },
-            "timestamp": datetime.now().isoformat()
+            "timestamp": datetime.now(timezone.utc).isoformat()
         }
     except Exception as e:
         logger.error(f"Error getting system status: {e}")
-        return JSONResponse(status_code=500, content={"status": "error", "error": str(e)})
+        return ORJSONResponse(status_code=500, content={"status": "error", "error": str(e)})
 
 # --- UI Interaction Endpoints ---
 # Dynamic hostname based on actual system
-SELF_GPU_AGENT_HOSTNAME = f"{socket.gethostname()}-GPU-Detected"
+SELF_GPU_AGENT_HOSTNAME = f"{get_hostname()}-GPU-Detected"
+
+# One detector for the control plane keeps NVML handles and its preferred method between
+# calls; results are reused briefly so repeated or concurrent detects share one pass
+SELF_DETECTION_TTL = 1.0  # seconds
+self_gpu_detector = GPUDetector()
+_self_detection = {"ts": 0.0, "result": None}
+_self_detection_lock = threading.Lock()
+
+def detect_self_gpus_cached(ttl: float = SELF_DETECTION_TTL) -> dict:
+    """Latest local GPU detection, re-run only once the cached result is older than ttl."""
+    with _self_detection_lock:
+        if _self_detection["result"] is None or time.monotonic() - _self_detection["ts"] >= ttl:
+            _self_detection["result"] = self_gpu_detector.detect_gpus()
+            _self_detection["ts"] = time.monotonic()
+        return _self_detection["result"]
 
 @app.post("/gpu/detect", tags=["UI Interaction"])
 def detect_self_gpu(db: Session = Depends(get_db)):
     """Detect GPUs on the control plane server - network binding independent"""
     try:
+        now = datetime.now(timezone.utc)
         logger.info("Starting GPU detection on control plane")
-        detector = GPUDetector()
-        report_data = detector.detect_gpus()
+        report_data = detect_self_gpus_cached()
 
         if report_data['status'] == 'mock' or not report_data.get('gpus'):
-            return JSONResponse(
+            return ORJSONResponse(
                 status_code=200,  # Changed from 404
                 content={
                     "status": "no_gpus",
@@ -598,41 +941,41 @@ def detect_self_gpu(db: Session = Depends(get_db)):
                 hostname=SELF_GPU_AGENT_HOSTNAME,
                 ip_address=get_local_ip(),  # Use actual control plane IP
                 os="Control Plane Host",
-                last_seen=datetime.now()
+                last_seen=now
             )
             db.add(agent)
             db.flush()
         else:
-            agent.last_seen = datetime.now()
-
-        # Clear existing GPUs
-        db.query(GPU).filter_by(agent_id=agent.id).delete()
-
-        # Add detected GPUs
-        gpus_added = 0
-        for gpu_data in report_data["gpus"]:
-            try:
-                gpu = GPU(
-                    id=gpu_data.get("id", f"GPU-{gpus_added}"),
-                    name=gpu_data.get("name", f"GPU-{gpus_added}"),
-                    model=gpu_data.get("model", "Unknown GPU"),
-                    status=gpu_data.get("status", "healthy"),
-                    temperature=gpu_data.get("temperature", 0),
-                    utilization=gpu_data.get("utilization", 0),
-                    memory_total=gpu_data.get("memoryTotal", 0),
-                    memory_used=gpu_data.get("memoryUsed", 0),
-                    agent_id=agent.id,
-                    vram=gpu_data.get("memoryTotal", 0) // (1024**3) if gpu_data.get("memoryTotal") else 0,
-                    is_available=gpu_data.get("status") == "healthy",
-                    pci_bus_id=gpu_data.get("pci_bus_id", "")
-                )
-                db.add(gpu)
-                gpus_added += 1
-            except Exception as e:
-                logger.error(f"Error adding detected GPU: {e}")
-                continue
+            agent.last_seen = now
+
+        # Clear existing GPUs, keeping their smoothed telemetry
+        previous_ema = replace_agent_gpus(db, [agent.id])
+
+        # Add detected GPUs in one bulk INSERT
+        gpu_rows = [{
+            "id": gpu_data.get("id", f"GPU-{index}"),
+            "pci_index": gpu_index_from_id(gpu_data.get("id", f"GPU-{index}")),
+            "name": gpu_data.get("name", f"GPU-{index}"),
+            "model": gpu_data.get("model", "Unknown GPU"),
+            "status": gpu_data.get("status", "healthy"),
+            "temperature": gpu_data.get("temperature", 0),
+            "utilization": gpu_data.get("utilization", 0),
+            "memory_total": gpu_data.get("memoryTotal", 0),
+            "memory_used": gpu_data.get("memoryUsed", 0),
+            "agent_id": agent.id,
+            "is_available": gpu_data.get("status") == "healthy",
+            "pci_bus_id": gpu_data.get("pci_bus_id", "")
+        } for index, gpu_data in enumerate(report_data["gpus"])]
+        for row in gpu_rows:
+            smooth_gpu_telemetry(row, previous_ema.get(row["id"]))
+        db.bulk_insert_mappings(GPU, gpu_rows)
+        record_gpu_samples(db, gpu_rows, now)
+        prune_gpu_samples(db, now)
+        gpus_added = len(gpu_rows)
         
         db.commit()
+        invalidate_topology_cache()
+        scheduler.invalidate_gpu_ranking()
         logger.info(f"Successfully detected and added {gpus_added} GPUs")
 
         return {
@@ -645,9 +988,8 @@ def detect_self_gpu(db: Session = Depends(get_db)):
         
     except Exception as e:
         db.rollback()
-        logger.error(f"GPU detection error: {e}")
-        traceback.print_exc()
-        return JSONResponse(
+        logger.exception("GPU detection error")
+        return ORJSONResponse(
             status_code=500, 
             content={"status": "error", "message": str(e)}
         )
@@ -656,30 +998,35 @@ def detect_self_gpu(db: Session = Depends(get_db)):
 def get_self_gpu(db: Session = Depends(get_db)):
     """Get GPUs detected on the control plane server"""
     try:
-        agent = db.query(Agent).filter_by(hostname=SELF_GPU_AGENT_HOSTNAME).first()
+        # One round-trip: the outer join yields a single row with NULL GPU columns
+        # when the agent exists without GPUs, and no rows when it was never detected.
+        # Core rows come back as mappings, so no ORM objects are hydrated.
+        rows = db.execute(
+            select(Agent.id.label("self_agent_id"), *GPU.__table__.columns)
+            .select_from(Agent)
+            .outerjoin(GPU, GPU.agent_id == Agent.id)
+            .where(Agent.hostname == SELF_GPU_AGENT_HOSTNAME)
+        ).mappings().all()
         
-        if not agent:
+        if not rows:
             return {
                 "status": "no_agent",
                 "gpu": None,
                 "message": "No self-detected GPUs found. Run detection first."
             }
         
-        gpus = db.query(GPU).filter_by(agent_id=agent.id).all()
+        gpu_data = [
+            {key: value for key, value in row.items() if key != "self_agent_id"}
+            for row in rows if row["id"] is not None
+        ]
         
-        if not gpus:
+        if not gpu_data:
             return {
                 "status": "no_gpus",
                 "gpu": None,
                 "message": "No GPUs found for this agent."
             }
         
-        # Return GPU data
-        gpu_data = []
-        for gpu in gpus:
-            gpu_dict = {c.name: getattr(gpu, c.name) for c in gpu.__table__.columns}
-            gpu_data.append(gpu_dict)
-        
         return {
             "status": "success",
             "gpu": gpu_data[0] if gpu_data else None,
@@ -689,7 +1036,7 @@ def get_self_gpu(db: Session = Depends(get_db)):
         
     except Exception as e:
         logger.error(f"Error getting self GPU: {e}")
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=500,
             content={"status": "error", "error": str(e)}
         )
@@ -699,21 +1046,24 @@ app.include_router(agent_router)
 app.include_router(api_router)
 
 # --- Health Check ---
+HEALTH_PAYLOAD = {
+    "status": "healthy",
+    "service": "GPU Nebula Control Plane",
+    "version": "2.1.0",
+}
+
 @app.get("/health")
-def health_check():
+async def health_check():
     """Simple health check endpoint"""
-    return {
-        "status": "healthy",
-        "service": "GPU Nebula Control Plane",
-        "version": "2.1.0",
-        "timestamp": datetime.now().isoformat()
-    }
+    # Nothing here blocks, so answer on the event loop rather than via the threadpool
+    return {**HEALTH_PAYLOAD, "timestamp": datetime.now(timezone.utc).isoformat()}
 
 # --- Main Entry Point ---
 if __name__ == "__main__":
     import uvicorn
     logger.info("Starting GPU Nebula Control Plane...")
-    # Bind to the specific IP address
+    # Bind to the specific IP address. Stay on one worker: startup recreates the database,
+    # and the report buffer, job monitor loop and local job processes live in this process.
     uvicorn.run(
         app, 
         host="0.0.0.0",
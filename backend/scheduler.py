@@ -1,18 +1,105 @@
+import asyncio
 import subprocess
+import shlex
+import shutil
 import psutil
 import json
 import os
-from datetime import datetime
+import signal
+import socket
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from contextlib import suppress
+from functools import lru_cache
+from operator import attrgetter
 from typing import Optional, List, Dict
-from sqlalchemy.orm import Session
-from create_db import Job, GPU, Agent, History, engine, SessionLocal
+from sqlalchemy import func, and_, update
+from sqlalchemy.orm import Session, joinedload, selectinload
+from sqlalchemy.orm.attributes import set_committed_value
+from create_db import Job, JobStatus, GPU, Agent, History, engine, session_factory
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from collections import defaultdict
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:  # Optional: GPU scoring falls back to the per-GPU Python loop
+    HAS_NUMPY = False
+
+logger = logging.getLogger(__name__)
+
+# The machine's hostname does not change while the process runs
+LOCAL_HOSTNAME = socket.gethostname()
+
+# Local jobs run from the backend directory, wherever the checkout lives
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+@lru_cache(maxsize=256)
+def resolve_executable(program: str) -> str:
+    """Absolute path of a job's program, looked up on PATH once per name."""
+    return shutil.which(program) or program
+
+def signal_job_process(pid: int, sig: int = signal.SIGTERM):
+    """
+    Signal a job together with its children. Jobs lead their own process group on POSIX;
+    a PID that leads no group (e.g. launched before that was the case) is signalled alone.
+    Raises ProcessLookupError if nothing is left to signal.
+    """
+    if os.name == "posix":
+        try:
+            os.killpg(pid, sig)
+            return
+        except ProcessLookupError:
+            pass
+    os.kill(pid, sig)
+
+# Terminal job states: a job in one of these never runs again
+FINISHED_JOB_STATUSES = (JobStatus.COMPLETED, JobStatus.FAILED, JobStatus.CANCELLED)
+
+# GPU fields read by the priority score, fetched in one call per GPU
+GPU_SCORE_FIELDS = attrgetter("temp_ema", "temperature", "util_ema", "utilization", "memory_used", "memory_total")
 
 class JobScheduler:
     AGENT_PORT = 8001
+    # Seconds a computed GPU ranking is reused; telemetry changes slower than job bursts arrive
+    RANK_TTL = float(os.environ.get("SCHEDULER_RANK_TTL", "2.0"))
+    # GPU score weights: temperature, utilization, active jobs, memory usage
+    SCORE_WEIGHTS = (2.0, 3.0, 5.0, 1.5)
+    # Unweighted score of each active job on a GPU
+    ACTIVE_JOB_SCORE = 20
+    # Monitoring cadence: the base delay doubles after each pass with no job transitions
+    MONITOR_BASE_INTERVAL = float(os.environ.get("MONITOR_BASE_INTERVAL", "1.0"))
+    MONITOR_MAX_INTERVAL = float(os.environ.get("MONITOR_MAX_INTERVAL", "30.0"))
 
     def __init__(self):
-        self.session_factory = SessionLocal
+        # Plain sessions: the scheduler manages its own commits, so it must not share
+        # (and close) the request-scoped session of the endpoint calling it
+        self.session_factory = session_factory
+        # Cached [score, gpu_id] pairs, best first; endpoints schedule from several threads
+        self._gpu_ranking = []
+        self._gpu_ranking_ts = 0.0
+        self._ranking_lock = threading.Lock()
+        # Keep-alive HTTP session shared by the synchronous agent calls (launch, cancel)
+        self._http = requests.Session()
+        # Retries cover connection failures and gateway errors; urllib3 only retries the
+        # status codes for idempotent methods, so job launches (POST) are never sent twice
+        adapter = HTTPAdapter(
+            pool_connections=32,
+            pool_maxsize=64,
+            max_retries=Retry(total=2, backoff_factor=0.1, status_forcelist=[502, 503, 504])
+        )
+        self._http.mount("http://", adapter)
+        self._http.mount("https://", adapter)
+        # Popen handles of jobs launched by this process, by job id
+        self._local_procs: Dict[int, subprocess.Popen] = {}
+        # Serializes monitor passes (background loop and /jobs/monitor); created on first use
+        # so it belongs to the running event loop
+        self._monitor_lock: Optional[asyncio.Lock] = None
+        self._no_change_ticks = 0
     
     def schedule_job(self, workload_type: str, command: str, preferred_gpu: Optional[str] = None) -> dict:
         """Main scheduling function - finds best GPU using temperature and utilization"""
@@ -32,36 +119,26 @@ class JobScheduler:
                 job = Job(
                     workload_type=workload_type,
                     command=command,
-                    status="queued"
+                    status=JobStatus.QUEUED
                 )
                 db.add(job)
-                db.commit()
-                
+                db.flush()  # Assigns job.id for the history row
                 self._log_job_history(db, job.id, "queued", "No available GPUs, job queued")
+                db.commit()
                 return {"status": "queued", "job_id": job.id, "message": "No GPUs available"}
             
             # Create job record
             job = Job(
                 workload_type=workload_type,
                 command=command,
-                status="pending",
+                status=JobStatus.PENDING,
                 assigned_gpu_id=selected_gpu.id,
                 agent_id=selected_gpu.agent_id
             )
             db.add(job)
             db.commit()
             
-            # Launch job
-            if self._is_local_gpu(db, selected_gpu):
-                success = self._launch_local_job(db, job, selected_gpu)
-            else:
-                success = self._launch_remote_job(db, job, selected_gpu)
-            
-            if success:
-                job.status = "running"
-                job.started_at = datetime.now()
-                db.commit()
-                self._log_job_history(db, job.id, "started", f"Job running on {selected_gpu.name} (Temp: {selected_gpu.temperature}°C, Util: {selected_gpu.utilization}%)")
+            if self._start_job(db, job, selected_gpu):
                 return {
                     "status": "running", 
                     "job_id": job.id, 
@@ -70,57 +147,177 @@ class JobScheduler:
                     "gpu_util": selected_gpu.utilization
                 }
             else:
-                job.status = "failed"
-                db.commit()
-                self._log_job_history(db, job.id, "failed", "Failed to launch job")
                 return {"status": "failed", "job_id": job.id, "error": "Launch failed"}
                 
         except Exception as e:
-            print(f"Scheduler error: {e}")
+            logger.exception("Scheduler error")
             return {"status": "error", "message": str(e)}
         finally:
             db.close()
     
+    def schedule_pending(self, max_n: int = 50) -> dict:
+        """
+        Assign queued jobs, oldest first, to the best available GPUs. The whole batch is
+        placed from one ranking pass: each launch adds its penalty to the cached scores,
+        so later jobs in the batch spread across GPUs without re-querying.
+        """
+        db = self.session_factory()
+        try:
+            queued_jobs = db.query(Job).filter(Job.status == JobStatus.QUEUED).order_by(
+                Job.created_at, Job.id
+            ).limit(max_n).all()
+            started = failed = 0
+            
+            for job in queued_jobs:
+                gpu = self._find_optimal_gpu(db)
+                if not gpu:
+                    break  # Still nothing available; the rest stay queued
+                job.status = JobStatus.PENDING
+                job.assigned_gpu_id = gpu.id
+                job.agent_id = gpu.agent_id
+                self._log_job_history(db, job.id, "scheduled", f"Dequeued onto {gpu.name}")
+                db.commit()
+                if self._start_job(db, job, gpu):
+                    started += 1
+                else:
+                    failed += 1
+            
+            if started or failed:
+                logger.info("Scheduled %d queued job(s): %d running, %d failed",
+                            started + failed, started, failed)
+            return {"started": started, "failed": failed, "queued": len(queued_jobs) - started - failed}
+        except Exception as e:
+            logger.exception("Error scheduling queued jobs")
+            return {"status": "error", "message": str(e)}
+        finally:
+            db.close()
+    
+    def _start_job(self, db: Session, job: Job, gpu: GPU) -> bool:
+        """Launch a pending job on its assigned GPU and record the outcome (commits)"""
+        if self._is_local_gpu(db, gpu):
+            success = self._launch_local_job(db, job, gpu)
+        else:
+            success = self._launch_remote_job(db, job, gpu)
+        
+        now = datetime.now(timezone.utc)
+        if success:
+            job.status = JobStatus.RUNNING
+            job.started_at = now
+            self._log_job_history(db, job.id, "started", f"Job running on {gpu.name} (Temp: {gpu.temperature}°C, Util: {gpu.utilization}%)", now)
+            db.commit()
+            self._record_gpu_assignment(gpu.id)
+        else:
+            job.status = JobStatus.FAILED
+            self._log_job_history(db, job.id, "failed", "Failed to launch job", now)
+            db.commit()
+        return success
+    
     def _find_optimal_gpu(self, db: Session) -> Optional[GPU]:
         """
         Smart GPU selection algorithm:
         Priority: Lower temperature + Lower utilization + Fewer active jobs
+        
+        The ranking is cached for RANK_TTL seconds so bursts of submissions skip the
+        query and scoring pass; launches adjust the cached scores in place.
         """
-        # Get all healthy, available GPUs
-        available_gpus = db.query(GPU).filter(
-            GPU.status == "healthy",
-            GPU.is_available == True
-        ).all()
+        best_gpu = None
+        for attempt in range(2):
+            with self._ranking_lock:
+                # Re-rank when the cache is stale, or when the cached pick vanished or stopped
+                # being schedulable because its agent reported since the ranking was taken
+                if attempt or not self._gpu_ranking or time.monotonic() - self._gpu_ranking_ts >= self.RANK_TTL:
+                    self._gpu_ranking = self._rank_gpus(db)
+                    self._gpu_ranking_ts = time.monotonic()
+                if not self._gpu_ranking:
+                    return None
+                best_score, best_gpu_id = self._gpu_ranking[0]
+            
+            best_gpu = db.get(GPU, best_gpu_id)
+            if best_gpu is not None and best_gpu.status == "healthy" and best_gpu.is_available:
+                break
+            best_gpu = None
         
-        if not available_gpus:
-            return None
+        if best_gpu:
+            logger.debug("Selected GPU %s with score %.2f", best_gpu.name, best_score)
         
-        # Count active jobs per GPU
-        active_jobs_per_gpu = {}
-        active_jobs = db.query(Job).filter(Job.status.in_(["running", "pending"])).all()
+        return best_gpu
+    
+    def _rank_gpus(self, db: Session) -> List[list]:
+        """Score all healthy, available GPUs and return [score, gpu_id] pairs, best first"""
+        candidate_filter = (GPU.status == "healthy", GPU.is_available == True)
         
-        for job in active_jobs:
-            gpu_id = job.assigned_gpu_id
-            if gpu_id:
-                active_jobs_per_gpu[gpu_id] = active_jobs_per_gpu.get(gpu_id, 0) + 1
+        # A lone candidate wins regardless of score, so skip the job-count aggregate
+        # (the common single-GPU developer setup); this probe is served by the index
+        candidates = db.query(GPU.id).filter(*candidate_filter).limit(2).all()
+        if not candidates:
+            return []
+        if len(candidates) == 1:
+            return [[0.0, candidates[0].id]]
+        
+        # Healthy, available GPUs with their active job counts in one aggregate query
+        available_gpus = db.query(GPU, func.count(Job.id)).outerjoin(
+            Job,
+            and_(Job.assigned_gpu_id == GPU.id, Job.status.in_([JobStatus.RUNNING, JobStatus.PENDING]))
+        ).filter(*candidate_filter).group_by(GPU.id).all()
+        
+        if not available_gpus:
+            return []
         
         # Score each GPU (lower score = better)
-        best_gpu = None
-        best_score = float('inf')
+        if HAS_NUMPY:
+            scores = self._calculate_gpu_priority_scores(available_gpus)
+        else:
+            scores = [
+                self._calculate_gpu_priority_score(gpu, active_jobs_count)
+                for gpu, active_jobs_count in available_gpus
+            ]
         
-        for gpu in available_gpus:
-            score = self._calculate_gpu_priority_score(gpu, active_jobs_per_gpu.get(gpu.id, 0))
-            
-            print(f"GPU {gpu.name}: Score={score:.2f} (Temp: {gpu.temperature}°C, Util: {gpu.utilization}%, Jobs: {active_jobs_per_gpu.get(gpu.id, 0)})")
-            
-            if score < best_score:
-                best_score = score
-                best_gpu = gpu
+        if logger.isEnabledFor(logging.DEBUG):
+            for (gpu, active_jobs_count), score in zip(available_gpus, scores):
+                logger.debug("GPU %s: Score=%.2f (Temp: %s°C, Util: %s%%, Jobs: %d)",
+                             gpu.name, score, gpu.temperature, gpu.utilization, active_jobs_count)
         
-        if best_gpu:
-            print(f"✅ Selected GPU: {best_gpu.name} with score {best_score:.2f}")
+        ranking = sorted([score, gpu.id] for (gpu, _), score in zip(available_gpus, scores))
+        return ranking
+    
+    def _calculate_gpu_priority_scores(self, available_gpus: list) -> List[float]:
+        """
+        Vectorized _calculate_gpu_priority_score over (gpu, active_jobs_count) pairs.
+        Same factors, weights and defaults, computed in one NumPy pass.
+        """
+        count = len(available_gpus)
+        temp = np.fromiter((gpu.temp_ema or gpu.temperature or 50 for gpu, _ in available_gpus), dtype=np.float64, count=count)
+        util = np.fromiter((gpu.util_ema or gpu.utilization or 0 for gpu, _ in available_gpus), dtype=np.float64, count=count)
+        mem_used = np.fromiter((gpu.memory_used or 0 for gpu, _ in available_gpus), dtype=np.float64, count=count)
+        mem_total = np.fromiter((gpu.memory_total or 0 for gpu, _ in available_gpus), dtype=np.float64, count=count)
+        jobs = np.fromiter((jobs for _, jobs in available_gpus), dtype=np.float64, count=count)
         
-        return best_gpu
+        temp_score = np.where(temp > 80, temp * 2, temp)  # Heavy penalty for hot GPUs
+        has_memory = (mem_total > 0) & (mem_used > 0)
+        memory_usage_pct = np.where(has_memory, mem_used / np.where(has_memory, mem_total, 1) * 100, 50)
+        
+        w_temp, w_util, w_jobs, w_memory = self.SCORE_WEIGHTS
+        total_score = temp_score * w_temp + util * w_util + jobs * self.ACTIVE_JOB_SCORE * w_jobs + memory_usage_pct * w_memory
+        return total_score.tolist()
+    
+    @property
+    def job_score_penalty(self) -> float:
+        """Score a launched job adds to its GPU: exactly one more active job at the current weights"""
+        return self.ACTIVE_JOB_SCORE * self.SCORE_WEIGHTS[2]
+    
+    def _record_gpu_assignment(self, gpu_id: str):
+        """Account for a job launched on gpu_id in the cached ranking"""
+        with self._ranking_lock:
+            for entry in self._gpu_ranking:
+                if entry[1] == gpu_id:
+                    entry[0] += self.job_score_penalty
+                    self._gpu_ranking.sort()
+                    break
+    
+    def invalidate_gpu_ranking(self):
+        """Force the next auto-scheduled job to re-rank GPUs"""
+        with self._ranking_lock:
+            self._gpu_ranking_ts = 0.0
     
     def _calculate_gpu_priority_score(self, gpu: GPU, active_jobs_count: int) -> float:
         """
@@ -134,48 +331,45 @@ class JobScheduler:
         4. Memory usage (weight: 1.5) - GPUs with more free memory preferred
         """
         
-        # Temperature score (0-100, but penalize high temps more)
-        temp = gpu.temperature or 50
-        if temp > 80:
-            temp_score = temp * 2  # Heavy penalty for hot GPUs
-        else:
-            temp_score = temp
+        temp_ema, temp, util_ema, util, memory_used, memory_total = GPU_SCORE_FIELDS(gpu)
+        w_temp, w_util, w_jobs, w_memory = self.SCORE_WEIGHTS
+        
+        # Temperature score (0-100, but penalize high temps more); smoothed when available
+        temp = temp_ema or temp or 50
+        temp_score = temp * 2 if temp > 80 else temp  # Heavy penalty for hot GPUs
         
         # Utilization score (0-100)
-        util_score = gpu.utilization or 0
+        util_score = util_ema or util or 0
         
         # Active jobs score (exponential penalty)
-        jobs_score = active_jobs_count * 20  # Heavy penalty for multiple jobs
+        jobs_score = active_jobs_count * self.ACTIVE_JOB_SCORE  # Heavy penalty for multiple jobs
         
         # Memory usage score
-        if gpu.memory_total and gpu.memory_used:
-            memory_usage_pct = (gpu.memory_used / gpu.memory_total) * 100
+        if memory_total and memory_used:
+            memory_usage_pct = (memory_used / memory_total) * 100
         else:
             memory_usage_pct = 50  # Default assumption
         
-        # Calculate weighted total score
-        total_score = (
-            temp_score * 2.0 +      # Temperature weight
-            util_score * 3.0 +      # Utilization weight  
-            jobs_score * 5.0 +      # Job count weight (highest)
-            memory_usage_pct * 1.5  # Memory usage weight
-        )
-        
-        return total_score
+        return temp_score * w_temp + util_score * w_util + jobs_score * w_jobs + memory_usage_pct * w_memory
     
     def _is_local_agent(self, db: Session, agent_id: int) -> bool:
         """
         Check if the agent_id corresponds to an agent running on the local machine.
         This is more robust than checking for a single hostname.
         """
-        import socket
-        hostname = socket.gethostname()
         # An agent is local if its hostname contains the local machine's hostname.
         # This covers both the main agent and the self-detected agent.
-        agent = db.query(Agent).filter(Agent.id == agent_id).first()
+        agent = db.get(Agent, agent_id) if agent_id is not None else None
         if not agent:
             return False
-        return hostname in agent.hostname
+        return LOCAL_HOSTNAME in agent.hostname
+    
+    def _local_agent_ids(self, db: Session) -> set:
+        """IDs of all agents running on the local machine (same rule as _is_local_agent)"""
+        return {
+            agent_id for agent_id, hostname in db.query(Agent.id, Agent.hostname)
+            if LOCAL_HOSTNAME in hostname
+        }
 
     def _is_local_gpu(self, db: Session, gpu: GPU) -> bool:
         return self._is_local_agent(db, gpu.agent_id)
@@ -183,12 +377,8 @@ class JobScheduler:
     def _launch_local_job(self, db: Session, job: Job, gpu: GPU) -> bool:
         """Launch job on local GPU using subprocess"""
         try:
-            import shlex
-            # Extract GPU index from its ID (e.g., "GPU-0" -> 0)
-            try:
-                gpu_index = int(gpu.id.split('-')[-1])
-            except (ValueError, IndexError):
-                gpu_index = 0  # Fallback
+            # Index parsed from the GPU ID when it was stored (e.g., "GPU-0" -> 0)
+            gpu_index = gpu.pci_index or 0
             
             # Set CUDA device and launch
             env = {
@@ -196,28 +386,33 @@ class JobScheduler:
                 'CUDA_VISIBLE_DEVICES': str(gpu_index)
             }
             
+            argv = shlex.split(job.command)
+            argv[0] = resolve_executable(argv[0])
+            
             process = subprocess.Popen(
-                shlex.split(job.command),
+                argv,
                 shell=False,  # Important for security
                 env=env,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
-                cwd="c:/dev/GPU-Nebula/backend/"
+                cwd=BACKEND_DIR,
+                # Own process group, so cancel_job can signal the job and its children together
+                start_new_session=(os.name == "posix")
             )
             
             job.pid = process.pid
+            self._local_procs[job.id] = process
             db.commit()
-            print(f"✅ Launched job {job.id} with PID {process.pid} on GPU {gpu_index} ({gpu.name})")
+            logger.info("Launched job %s with PID %s on GPU %s (%s)", job.id, process.pid, gpu_index, gpu.name)
             return True
             
         except Exception as e:
-            print(f"❌ Failed to launch local job: {e}")
+            logger.error("Failed to launch local job: %s", e)
             return False
     
     def _launch_remote_job(self, db: Session, job: Job, gpu: GPU) -> bool:
         """Launch job on remote agent via API"""
         try:
-            import requests
             agent = gpu.agent
             
             payload = {
@@ -227,8 +422,8 @@ class JobScheduler:
                 "workload_type": job.workload_type
             }
             
-            response = requests.post(
-                f"http://{agent.ip_address}:8001/agent/run-job",
+            response = self._http.post(
+                f"http://{agent.ip_address}:{self.AGENT_PORT}/agent/run-job",
                 json=payload,
                 timeout=30
             )
@@ -239,70 +434,208 @@ class JobScheduler:
                 db.commit()
                 return True
             else:
-                print(f"Remote launch failed: {response.text}")
+                logger.error("Remote launch failed: %s", response.text)
                 return False
                 
         except Exception as e:
-            print(f"Failed to launch remote job: {e}")
+            logger.error("Failed to launch remote job: %s", e)
             return False
     
-    def _log_job_history(self, db: Session, job_id: int, action: str, details: str):
-        """Log job event to history"""
+    def _log_job_history(self, db: Session, job_id: int, action: str, details: str, ts: Optional[datetime] = None):
+        """
+        Add a job event to history (ts defaults to the current UTC time).
+        The row is only staged: callers commit it together with the job change it records.
+        """
         history = History(
             job_id=job_id,
             action=action,
-            details=details
+            details=details,
+            timestamp=ts or datetime.now(timezone.utc)
         )
         db.add(history)
+    
+    async def monitor_jobs_async(self, http) -> int:
+        """
+        Monitor running jobs, both local and remote. Returns the number that finished.
+        Database work runs on a worker thread while the agents' batch status polls are
+        awaited together on the caller's shared httpx.AsyncClient, so no thread is held
+        for a network round trip.
+        """
+        if self._monitor_lock is None:
+            self._monitor_lock = asyncio.Lock()
+        # Overlapping passes would record the same transitions twice
+        async with self._monitor_lock:
+            return await self._monitor_pass(http)
+    
+    async def _monitor_pass(self, http) -> int:
+        now = datetime.now(timezone.utc)
+        db = self.session_factory()
+        try:
+            running_jobs, jobs_by_agent = await asyncio.to_thread(self._check_local_jobs, db, now)
+            agents = list(jobs_by_agent)
+            results = await asyncio.gather(*(
+                http.post(
+                    self._job_status_batch_url(agent),
+                    json={"pids": [job.pid for job in jobs_by_agent[agent]]},
+                    timeout=10
+                )
+                for agent in agents
+            ), return_exceptions=True)
+            return await asyncio.to_thread(
+                self._finish_monitor_pass, db, running_jobs, jobs_by_agent, dict(zip(agents, results)), now
+            )
+        finally:
+            await asyncio.to_thread(db.close)
+    
+    def next_monitor_interval(self, transitions: int) -> float:
+        """Seconds until the next monitoring pass: back off while idle, reset on any change"""
+        self._no_change_ticks = 0 if transitions else min(self._no_change_ticks + 1, 16)
+        return min(self.MONITOR_MAX_INTERVAL, self.MONITOR_BASE_INTERVAL * 2 ** self._no_change_ticks)
+    
+    def reset_monitor_interval(self):
+        """Return to the base monitoring cadence, e.g. once new work has arrived"""
+        self._no_change_ticks = 0
+    
+    def _job_status_batch_url(self, agent: Agent) -> str:
+        return f"http://{agent.ip_address}:{self.AGENT_PORT}/agent/job-status-batch"
+    
+    def _check_local_jobs(self, db: Session, now: datetime):
+        """
+        Update running jobs on this host from their processes. Returns the running jobs and
+        the remote ones still to be polled, grouped by agent.
+        """
+        # Remote jobs are grouped by agent below; load those agents in one IN query
+        running_jobs = db.query(Job).options(selectinload(Job.agent)).filter(
+            Job.status == JobStatus.RUNNING
+        ).all()
+        local_agent_ids = self._local_agent_ids(db)
+        jobs_by_agent = defaultdict(list)
+        
+        for job in running_jobs:
+            if not job.pid:
+                continue
+
+            process = self._local_procs.get(job.id) if job.agent_id in local_agent_ids else None
+            if process is not None:
+                # Launched by this process: poll() is a non-blocking waitpid that also
+                # reaps the child and gives us its exit code
+                return_code = process.poll()
+                if return_code is not None:
+                    self._local_procs.pop(job.id, None)
+                    status = JobStatus.COMPLETED if return_code == 0 else JobStatus.FAILED
+                    self._finish_running_job(db, job, status, f"Job process exited with code {return_code}.", now)
+            elif job.agent_id in local_agent_ids:
+                # Recovered from the DB after a restart: monitor local job using psutil
+                try:
+                    process = psutil.Process(job.pid)
+                    if not process.is_running():
+                        self._finish_running_job(db, job, JobStatus.COMPLETED, "Job process finished.", now)
+                except psutil.NoSuchProcess:
+                    # Assume completed if process is gone
+                    self._finish_running_job(db, job, JobStatus.COMPLETED, "Job process not found, assuming completed.", now)
+            elif job.agent:
+                jobs_by_agent[job.agent].append(job)
+        
+        return running_jobs, jobs_by_agent
+    
+    def _finish_running_job(self, db: Session, job: Job, status: JobStatus, details: str, now: datetime):
+        """
+        Move a job from running to a finished status and record it, unless another writer
+        (e.g. cancel_job) already moved it on since this pass loaded it. The check is part
+        of the UPDATE, so an exit caused by a cancel cannot overwrite "cancelled".
+        """
+        result = db.execute(
+            update(Job).where(Job.id == job.id, Job.status == JobStatus.RUNNING)
+            .values(status=status, finished_at=now),
+            execution_options={"synchronize_session": False}
+        )
+        if result.rowcount:
+            set_committed_value(job, "status", status)
+            set_committed_value(job, "finished_at", now)
+            self._log_job_history(db, job.id, status.label, details, now)
+        else:
+            db.expire(job, ["status", "finished_at"])  # Reload whatever the other writer set
+    
+    def _finish_monitor_pass(self, db: Session, running_jobs: List[Job], jobs_by_agent: dict,
+                             responses: dict, now: datetime):
+        """Apply each agent's batch status response (or the error polling it) and commit. Returns the number of jobs that finished."""
+        for agent, response in responses.items():
+            if isinstance(response, Exception):
+                logger.warning("Error contacting agent %s to monitor %d job(s): %s",
+                               agent.hostname, len(jobs_by_agent[agent]), response)
+            elif response.status_code == 200:
+                statuses = response.json()  # {pid: {"status": ...}}, keys are strings in JSON
+                for job in jobs_by_agent[agent]:
+                    status_data = statuses.get(str(job.pid), {})
+                    if status_data.get("status") in ["not_running", "not_found"]:
+                        self._finish_running_job(db, job, JobStatus.COMPLETED, f"Remote job finished on {agent.hostname}.", now)
+            else:
+                logger.warning("Could not get job statuses from agent %s. Status: %s",
+                               agent.hostname, response.status_code)
+        
+        # Reap local processes whose job left "running" some other way (e.g. cancelled).
+        # A job launched after this pass's query is absent from running_ids too, so only
+        # drop handles whose job is finished in the database; the rest keep their exit code.
+        running_ids = {job.id for job in running_jobs if job.status == JobStatus.RUNNING}
+        exited = [job_id for job_id, process in list(self._local_procs.items())
+                  if job_id not in running_ids and process.poll() is not None]
+        if exited:
+            ended = db.query(Job.id).filter(Job.id.in_(exited), Job.status.in_(FINISHED_JOB_STATUSES)).all()
+            for (job_id,) in ended:
+                self._local_procs.pop(job_id, None)
+        
         db.commit()
+        finished = len(running_jobs) - len(running_ids)
+        if finished:
+            # Finished jobs free up GPUs, so cached scores are out of date
+            self.invalidate_gpu_ranking()
+        return finished
     
-    def monitor_jobs(self):
-        """Background task to monitor running jobs, both local and remote."""
+    def cancel_job(self, job_id: int) -> dict:
+        """Cancel a queued or running job, terminating its process if it has one"""
+        now = datetime.now(timezone.utc)
         db = self.session_factory()
         try:
-            running_jobs = db.query(Job).filter(Job.status == "running").all()
+            job = db.query(Job).filter(Job.id == job_id).first()
+            if not job:
+                return {"status": "not_found", "error": "Job not found"}
             
-            for job in running_jobs:
-                if not job.pid:
-                    continue
-
-                is_local = self._is_local_agent(db, job.agent_id)
-
-                if is_local:
-                    # Monitor local job using psutil
-                    try:
-                        process = psutil.Process(job.pid)
-                        if not process.is_running():
-                            job.status = "completed"
-                            job.finished_at = datetime.now()
-                            self._log_job_history(db, job.id, "completed", "Job process finished.")
-                    except psutil.NoSuchProcess:
-                        job.status = "completed"  # Assume completed if process is gone
-                        job.finished_at = datetime.now()
-                        self._log_job_history(db, job.id, "completed", "Job process not found, assuming completed.")
-                else:
-                    # Monitor remote job via agent's API
-                    agent = job.agent
-                    if not agent:
-                        continue
-                    
+            if job.status not in (JobStatus.QUEUED, JobStatus.PENDING, JobStatus.RUNNING):
+                return {"status": "conflict", "error": f"Job {job_id} is already {job.status.label}"}
+            
+            if job.pid:
+                process = self._local_procs.get(job.id)
+                if process is not None and os.name == "posix":
+                    # Launched in its own session: the group id is the leader's PID even once
+                    # the leader has exited, so children it left behind are signalled too
+                    with suppress(ProcessLookupError):
+                        os.killpg(process.pid, signal.SIGTERM)  # Reaped by the next monitor pass
+                elif process is not None:
+                    process.terminate()
+                elif self._is_local_agent(db, job.agent_id):
+                    # Bare signals are single syscalls; psutil.Process() would parse /proc first
                     try:
-                        response = requests.get(
-                            f"http://{agent.ip_address}:{self.AGENT_PORT}/agent/job-status/{job.pid}",
-                            timeout=5
-                        )
-                        if response.status_code == 200:
-                            status_data = response.json()
-                            if status_data.get("status") in ["not_running", "not_found"]:
-                                job.status = "completed"
-                                job.finished_at = datetime.now()
-                                self._log_job_history(db, job.id, "completed", f"Remote job finished on {agent.hostname}.")
-                        else:
-                            print(f"⚠️ Could not get job status for {job.id} from agent {agent.hostname}. Status: {response.status_code}")
-                    except requests.RequestException as e:
-                        print(f"⚠️ Error contacting agent {agent.hostname} to monitor job {job.id}: {e}")
+                        signal_job_process(job.pid)
+                    except ProcessLookupError:
+                        pass  # Process already exited, just record the cancellation
+                elif job.agent:
+                    response = self._http.post(
+                        f"http://{job.agent.ip_address}:{self.AGENT_PORT}/agent/cancel-job/{job.pid}",
+                        timeout=10
+                    )
+                    if response.status_code != 200:
+                        return {"status": "error", "error": f"Agent {job.agent.hostname} could not cancel job: {response.text}"}
             
+            job.status = JobStatus.CANCELLED
+            job.finished_at = now
+            self._log_job_history(db, job.id, "cancelled", "Job cancelled by user.", now)
             db.commit()
+            self.invalidate_gpu_ranking()
+            return {"status": "cancelled", "job_id": job.id}
+            
+        except Exception as e:
+            logger.exception("Cancel error")
+            return {"status": "error", "error": str(e)}
         finally:
             db.close()
     
@@ -310,13 +643,15 @@ class JobScheduler:
         """Get current status of a job"""
         db = self.session_factory()
         try:
-            job = db.query(Job).filter(Job.id == job_id).first()
+            job = db.query(Job).options(
+                joinedload(Job.gpu), joinedload(Job.agent)
+            ).filter(Job.id == job_id).first()
             if not job:
                 return {"error": "Job not found"}
             
             return {
                 "id": job.id,
-                "status": job.status,
+                "status": job.status.label,
                 "workload_type": job.workload_type,
                 "command": job.command,
                 "gpu": job.gpu.name if job.gpu else None,
@@ -332,12 +667,15 @@ class JobScheduler:
         """List recent jobs"""
         db = self.session_factory()
         try:
-            jobs = db.query(Job).order_by(Job.created_at.desc()).limit(limit).all()
+            # GPU and agent names come from the same SELECT instead of 2 lazy loads per job
+            jobs = db.query(Job).options(
+                joinedload(Job.gpu), joinedload(Job.agent)
+            ).order_by(Job.created_at.desc()).limit(limit).all()
             
             return [{
                 "id": job.id,
                 "workload_type": job.workload_type,
-                "status": job.status,
+                "status": job.status.label,
                 "gpu": job.gpu.name if job.gpu else None,
                 "agent": job.agent.hostname if job.agent else None,
                 "created_at": job.created_at.isoformat(),
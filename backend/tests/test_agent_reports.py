@@ -0,0 +1,97 @@
+import os
+import sys
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from create_db import Base, GPU, GPUSample
+from main import GPU_SAMPLE_RETENTION, AgentReportIn, apply_agent_reports
+
+
+def make_report(temperature, utilization):
+    return AgentReportIn(**{
+        "agent_info": {"hostname": "ema-host", "ip_address": "10.0.0.9", "os": "Linux"},
+        "gpu_report": {
+            "detection_method": "nvidia_smi",
+            "status": "success",
+            "gpus": [{
+                "id": "GPU-0", "name": "GPU-0", "model": "Test GPU", "status": "healthy",
+                "temperature": temperature, "utilization": utilization
+            }]
+        }
+    })
+
+
+class TelemetryEMATest(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine("sqlite://")
+        Base.metadata.create_all(self.engine)
+
+    def tearDown(self):
+        self.engine.dispose()
+
+    def report(self, temperature, utilization):
+        with Session(self.engine) as db, db.begin():
+            apply_agent_reports(db, [make_report(temperature, utilization)], datetime.now(timezone.utc))
+        with Session(self.engine) as db:
+            return db.execute(select(GPU.temp_ema, GPU.util_ema).where(GPU.id == "GPU-0")).one()
+
+    def test_repeated_reports_keep_updating_ema(self):
+        self.report(80, 90)
+        temp_ema, util_ema = self.report(50, 10)
+        self.assertAlmostEqual(temp_ema, 71.0)
+        self.assertAlmostEqual(util_ema, 66.0)
+
+        # The same reading again leaves the inventory hash unchanged
+        previous = temp_ema
+        for _ in range(30):
+            temp_ema, util_ema = self.report(50, 10)
+            self.assertLess(temp_ema, previous)
+            previous = temp_ema
+        self.assertAlmostEqual(temp_ema, 50.0, places=2)
+        self.assertAlmostEqual(util_ema, 10.0, places=2)
+
+    def test_first_report_seeds_ema(self):
+        self.assertEqual(tuple(self.report(60, 20)), (60.0, 20.0))
+
+
+class GPUSampleRetentionTest(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine("sqlite://")
+        Base.metadata.create_all(self.engine)
+
+    def tearDown(self):
+        self.engine.dispose()
+
+    def test_old_samples_are_pruned_on_ingest(self):
+        now = datetime.now(timezone.utc)
+        with Session(self.engine) as db, db.begin():
+            db.add_all([
+                GPUSample(gpu_id="GPU-9", timestamp=now - GPU_SAMPLE_RETENTION - timedelta(minutes=1), temperature=1),
+                GPUSample(gpu_id="GPU-9", timestamp=now - GPU_SAMPLE_RETENTION / 2, temperature=2),
+            ])
+        with Session(self.engine) as db, db.begin():
+            apply_agent_reports(db, [make_report(60, 20)], now)
+        with Session(self.engine) as db:
+            kept = db.execute(select(GPUSample.gpu_id, GPUSample.temperature).order_by(GPUSample.id)).all()
+        self.assertEqual([tuple(row) for row in kept], [("GPU-9", 2), ("GPU-0", 60)])
+
+    def test_repeated_report_records_a_sample(self):
+        first, second = datetime.now(timezone.utc), datetime.now(timezone.utc) + timedelta(seconds=15)
+        for now in (first, second):
+            with Session(self.engine) as db, db.begin():
+                apply_agent_reports(db, [make_report(50, 30)], now)
+        with Session(self.engine) as db:
+            samples = db.execute(
+                select(GPUSample.gpu_id, GPUSample.timestamp, GPUSample.temperature, GPUSample.utilization)
+                .order_by(GPUSample.id)
+            ).all()
+        self.assertEqual([tuple(row) for row in samples], [("GPU-0", first, 50, 30), ("GPU-0", second, 50, 30)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -8,6 +8,16 @@ import './styles/App.css'
 
 const API_BASE_URL = `http://${window.location.hostname}:8080`;
 
+// The topology is fetched in columnar layout ({ field: [values] } per table) to keep
+// the payload small; turn each table back into the row objects the components use
+const fromColumns = (table) => {
+  const fields = Object.keys(table)
+  const count = fields.length > 0 ? table[fields[0]].length : 0
+  return Array.from({ length: count }, (_, i) =>
+    Object.fromEntries(fields.map(field => [field, table[field][i]]))
+  )
+}
+
 function App() {
   const [selectedNode, setSelectedNode] = useState(null)
   const [clusterData, setClusterData] = useState({
@@ -41,12 +51,18 @@ function App() {
   const loadData = async () => {
     try {
       console.log('🔄 Attempting to fetch data from backend...')
-      const response = await fetch(`${API_BASE_URL}/api/v1/topology`, {
+      const response = await fetch(`${API_BASE_URL}/api/v1/topology?layout=columnar`, {
         cache: 'no-store' // Tell the browser to always get a fresh response
       })
 
       if (response.ok) {
-        const backendData = await response.json()
+        const columnarData = await response.json()
+        const backendData = {
+          ...columnarData,
+          gpus: fromColumns(columnarData.gpus),
+          servers: fromColumns(columnarData.servers),
+          connections: fromColumns(columnarData.connections)
+        }
         console.log('✅ Successfully fetched data from backend:', backendData)
 
         setClusterData(backendData)